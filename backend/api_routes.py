@@ -1,61 +1,59 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from typing import List, Optional
-import logging
-from datetime import datetime
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from celery.result import AsyncResult
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncGenerator, AsyncIterator, List, Dict, Any
 import asyncio
-from config import settings    
+import functools
+import hashlib
+import logging
+import os
+import aiofiles.os as aios
+import orjson
+
+from config import settings
 from schemas import (
     DocumentResponse, DocumentListResponse, HealthResponse,
-    ErrorResponse, BaseResponse, DocumentChunksResponse,
-    ProcessDocumentRequest, DocumentChunk
+    BaseResponse, DocumentChunksResponse, ProcessDocumentRequest,
+    DocumentChunk, EmbeddingResponse
 )
 from utils import (
     get_file_type, validate_file_size, save_uploaded_file,
-    generate_file_id, validate_chunk_quality
+    generate_file_id, get_file_hash, now_cached, FileTooLargeError
+)
+from documents import (
+    embed_document_chunks, extract_text_to_cache, chunk_cached_text, iter_document_chunks,
+    get_text_cache_path, pdf_page_count, pdf_page_ranges, extract_pdf_pages,
+    save_document_to_db, save_chunks_to_db, save_chunk_embeddings, load_chunks_from_db,
+    update_document_status
 )
-from documents import document_processor, process_document_with_embeddings
-from schemas import EmbeddingResponse, DocumentChunkWithEmbedding
+from database import get_async_db, AsyncSessionLocal, SessionLocal, DBDocument, DBChunk
+from embedding import embedding_engine, embed_query_batched
 from rag import vector_store, rag_pipeline
 from llm import ollama_client
 from web_search import web_search
-
-from sqlalchemy.orm import Session
-from database import get_db, init_database, DBDocument, DBChunk
-from documents import save_document_to_db, save_chunks_to_db, update_document_status
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-import jwt
-import httpx
-import logging
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-import os
-from urllib.parse import urlencode
-import secrets
-from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import RedirectResponse
-from fastapi.exceptions import HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from cache import ttl_cache
+from tasks import celery_app, enqueue_document_pipeline
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-def get_database() -> Session:
-    return next(get_db())
-# In-memory storage for MVP (will be replaced with database)
-documents_store = {}
+# CPU-bound extraction and chunking run here so they don't block the event loop
+processing_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+async def require_ollama():
+    """Reject the request with 503 when Ollama is unreachable"""
+    if not await ollama_client.is_available():
+        raise HTTPException(status_code=503, detail="Ollama service unavailable")
 
 @router.get("/health", response_model=HealthResponse)
+@ttl_cache(ttl=5)
 async def health_check():
     """Health check endpoint"""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.now(),
+        timestamp=now_cached(),
         services={
             "api": "running",
             "database": "unknown",
@@ -67,8 +65,10 @@ async def health_check():
 
 @router.post("/documents/upload", response_model=DocumentResponse)
 async def upload_document(
+    request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload document endpoint with database storage"""
     try:
@@ -76,17 +76,6 @@ async def upload_document(
         if not file.filename:
             raise HTTPException(status_code=400, detail="No filename provided")
         
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        
-        # Validate file size (50MB limit)
-        if not validate_file_size(file_size):
-            raise HTTPException(
-                status_code=413, 
-                detail="File too large. Maximum size is 50MB"
-            )
-        
         # Get file type
         file_type = get_file_type(file.filename)
         if file_type == "unknown":
@@ -95,66 +84,66 @@ async def upload_document(
                 detail="Unsupported file type. Supported: PDF, DOCX, TXT, MD"
             )
         
-        # Save file
-        file_path = save_uploaded_file(content, file.filename)
+        # Reject oversized requests up front when the client declares a length
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and not validate_file_size(int(content_length)):
+            raise HTTPException(
+                status_code=413,
+                detail="File too large. Maximum size is 50MB"
+            )
         
-        # Extract text
+        # Stream file to disk (50MB limit enforced while copying)
         try:
-            extracted_text = document_processor.extract_text(file_path, file_type)
-            text_preview = extracted_text[:200] + "..." if len(extracted_text) > 200 else extracted_text
-        except Exception as e:
-            logger.error(f"Text extraction failed: {e}")
-            extracted_text = ""
-            text_preview = "Text extraction failed"
-        
+            file_path, file_size = await save_uploaded_file(file, file.filename)
+        except FileTooLargeError:
+            raise HTTPException(
+                status_code=413,
+                detail="File too large. Maximum size is 50MB"
+            )
+
         # Generate document ID
         doc_id = generate_file_id()
         
-        # Save to database
+        # Large files go to the Celery worker when enabled, the rest are
+        # extracted and chunked in-process after the response is sent
+        use_task_queue = (
+            settings.task_queue_enabled
+            and file_size >= settings.background_processing_max_size
+        )
+        processing_status = "queued" if use_task_queue else "processing"
+        
+        # Save to database (the only record of the upload); the hash is
+        # computed in a thread since run_sync runs on the event loop
         try:
-            db_document = save_document_to_db(
-                db=db,
+            file_hash = await asyncio.to_thread(get_file_hash, file_path)
+            db_document = await db.run_sync(
+                save_document_to_db,
                 doc_id=doc_id,
                 title=file.filename,
                 file_path=file_path,
                 file_type=file_type,
                 file_size=file_size,
-                text_preview=text_preview
-            )
-            
-            # Create response
-            document = DocumentResponse(
-                id=db_document.id,
-                title=db_document.title,
-                file_type=db_document.file_type,
-                size=db_document.file_size,
-                upload_time=db_document.upload_time,
-                processing_status=db_document.processing_status,
-                chunk_count=db_document.chunk_count,
-                text_preview=db_document.text_preview
-            )
-            
-        except Exception as db_error:
-            logger.error(f"Database save failed: {db_error}")
-            # Fallback to memory storage
-            document = DocumentResponse(
-                id=doc_id,
-                title=file.filename,
-                file_type=file_type,
-                size=file_size,
-                upload_time=datetime.now(),
-                processing_status="extracted",
-                chunk_count=0,
-                text_preview=text_preview
+                text_preview=None,
+                processing_status=processing_status,
+                file_hash=file_hash
             )
+        except Exception:
+            await aios.remove(file_path)
+            raise
         
-        # Store in memory for backward compatibility
-        documents_store[doc_id] = {
-            "document": document,
-            "file_path": file_path,
-            "extracted_text": extracted_text,
-            "chunks": []
-        }
+        document = _to_document_response(db_document)
+        
+        # Same content was uploaded before: drop the new copy and skip processing
+        if db_document.id != doc_id:
+            await aios.remove(file_path)
+            logger.info(f"Duplicate upload of {db_document.id}: {file.filename}")
+            return document
+        
+        # Hand off to the Celery worker, or extract after the response is sent
+        if use_task_queue:
+            document = document.model_copy(update={"task_id": enqueue_document_pipeline(doc_id)})
+        else:
+            background_tasks.add_task(_process_sync, doc_id)
         
         logger.info(f"Document uploaded: {file.filename} ({file_size} bytes)")
         return document
@@ -166,75 +155,133 @@ async def upload_document(
         raise HTTPException(status_code=500, detail="Upload failed")
 
 
+def _weak_etag(*parts) -> str:
+    """Build a weak ETag from the values a response depends on"""
+    digest = hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def _to_document_response(db_document: DBDocument) -> DocumentResponse:
+    """Build a document response from a trusted database row"""
+    return DocumentResponse.model_construct(
+        id=db_document.id,
+        title=db_document.title,
+        file_type=db_document.file_type,
+        size=db_document.file_size,
+        upload_time=db_document.upload_time,
+        processing_status=db_document.processing_status,
+        chunk_count=db_document.chunk_count,
+        text_preview=db_document.text_preview
+    )
+
+def _trusted_response(model, headers: Dict[str, str] = None) -> ORJSONResponse:
+    """Serialize a model built from trusted data, skipping response_model re-validation"""
+    return ORJSONResponse(content=model.model_dump(), headers=headers)
+
+def _to_chunk_models(chunks: List[Dict[str, Any]]) -> List[DocumentChunk]:
+    """Build chunk response models from chunk dicts"""
+    return [
+        DocumentChunk.model_construct(
+            id=chunk["id"],
+            index=chunk["index"],
+            text=chunk["text"],
+            length=chunk["length"],
+            created_at=chunk["created_at"]
+        )
+        for chunk in chunks
+    ]
+
+def _extract_to_cache(file_path: str, file_type: str) -> str:
+    """Extract text to its cache file, splitting large PDFs across the processing pool"""
+    if file_type == "pdf" and not os.path.exists(get_text_cache_path(file_path)):
+        # PDF libraries are not thread-safe, so even the page count is read in the pool
+        page_count = processing_pool.submit(pdf_page_count, file_path).result()
+        ranges = pdf_page_ranges(page_count, os.cpu_count() or 1)
+        if len(ranges) > 1:
+            # Each worker opens the PDF itself; pages are written back in order
+            futures = [
+                processing_pool.submit(extract_pdf_pages, file_path, start, stop)
+                for start, stop in ranges
+            ]
+            pages = (page for future in futures for page in future.result())
+            return extract_text_to_cache(file_path, file_type, pages)
+    
+    return processing_pool.submit(extract_text_to_cache, file_path, file_type).result()
+
+def _process_sync(doc_id: str):
+    """Extract and chunk an uploaded document in the background"""
+    db = SessionLocal()
+    try:
+        document = db.query(DBDocument).filter(DBDocument.id == doc_id).first()
+        if not document:
+            return
+        
+        # Text is written next to the upload page by page, then chunks are
+        # streamed from that file into the database batch by batch, so
+        # neither the full text nor the full chunk list is held in memory
+        text_preview = _extract_to_cache(document.file_path, document.file_type)
+        chunk_count = save_chunks_to_db(db, doc_id, iter_document_chunks(document.file_path))
+        update_document_status(db, doc_id, "chunked", chunk_count, text_preview)
+        
+        logger.info(f"Document processed in background: {doc_id} ({chunk_count} chunks)")
+        
+    except Exception as e:
+        logger.error(f"Background processing failed for {doc_id}: {e}", exc_info=True)
+        db.rollback()
+        update_document_status(db, doc_id, "failed")
+    finally:
+        db.close()
 
 @router.post("/documents/{doc_id}/process", response_model=DocumentChunksResponse)
 async def process_document(
     doc_id: str,
     request: ProcessDocumentRequest = ProcessDocumentRequest(),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Process document into chunks with database storage"""
     # Check in database first
-    db_document = db.query(DBDocument).filter(DBDocument.id == doc_id).first()
+    db_document = await db.get(DBDocument, doc_id)
     if not db_document:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    loop = asyncio.get_running_loop()
     try:
-        # Get extracted text (from memory store for now)
-        doc_data = documents_store.get(doc_id)
-        if not doc_data:
-            # Load from file if not in memory
-            extracted_text = document_processor.extract_text(db_document.file_path, db_document.file_type)
-        else:
-            extracted_text = doc_data["extracted_text"]
+        # Write the extracted text file (extracts only if it doesn't exist yet)
+        text_preview = await asyncio.to_thread(
+            _extract_to_cache,
+            db_document.file_path,
+            db_document.file_type
+        )
         
-        if not extracted_text:
+        if not text_preview:
             raise HTTPException(status_code=400, detail="No text extracted from document")
         
-        # Chunk the document
-        chunks = document_processor.chunk_document(
-            extracted_text,
-            chunk_size=request.chunk_size,
-            overlap=request.overlap
+        # Chunk the text file page by page, keeping quality chunks
+        quality_chunks = await loop.run_in_executor(
+            processing_pool,
+            functools.partial(
+                chunk_cached_text,
+                db_document.file_path,
+                chunk_size=request.chunk_size,
+                overlap=request.overlap
+            )
         )
         
-        # Filter quality chunks
-        quality_chunks = [
-            chunk for chunk in chunks
-            if validate_chunk_quality(chunk["text"])
-        ]
-        
         # Save chunks to database
-        save_chunks_to_db(db, doc_id, quality_chunks)
+        await db.run_sync(save_chunks_to_db, doc_id, quality_chunks)
         
         # Update document status
-        update_document_status(db, doc_id, "chunked", len(quality_chunks))
+        await db.run_sync(update_document_status, doc_id, "chunked", len(quality_chunks))
         
         # Convert to response format
-        chunk_responses = [
-            DocumentChunk(
-                id=chunk["id"],
-                index=chunk["index"],
-                text=chunk["text"],
-                length=chunk["length"],
-                created_at=chunk["created_at"]
-            )
-            for chunk in quality_chunks
-        ]
-        
-        # Update memory store for backward compatibility
-        if doc_id in documents_store:
-            documents_store[doc_id]["chunks"] = quality_chunks
-            documents_store[doc_id]["document"].chunk_count = len(quality_chunks)
-            documents_store[doc_id]["document"].processing_status = "chunked"
+        chunk_models = _to_chunk_models(quality_chunks)
         
         logger.info(f"Document chunked and saved to DB: {doc_id} ({len(quality_chunks)} chunks)")
         
-        return DocumentChunksResponse(
+        return _trusted_response(DocumentChunksResponse.model_construct(
             document_id=doc_id,
-            chunks=chunk_responses,
-            total_chunks=len(quality_chunks)
-        )
+            chunks=chunk_models,
+            total_chunks=len(chunk_models)
+        ))
         
     except HTTPException:
         raise
@@ -243,92 +290,177 @@ async def process_document(
         raise HTTPException(status_code=500, detail="Document processing failed")
 
 @router.get("/documents/{doc_id}/chunks", response_model=DocumentChunksResponse)
-async def get_document_chunks(doc_id: str):
+async def get_document_chunks(
+    doc_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get document chunks"""
-    if doc_id not in documents_store:
+    document = await db.get(DBDocument, doc_id)
+    if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc_data = documents_store[doc_id]
-    chunks = doc_data.get("chunks", [])
-    
-    chunk_responses = [
-        DocumentChunk(
-            id=chunk["id"],
-            index=chunk["index"],
-            text=chunk["text"],
-            length=chunk["length"],
-            created_at=chunk["created_at"]
-        )
-        for chunk in chunks
-    ]
+    # Chunk IDs are regenerated on every reprocess, so the first one tracks content
+    first_chunk_id = await db.scalar(
+        select(DBChunk.id)
+        .where(DBChunk.document_id == doc_id)
+        .order_by(DBChunk.chunk_index)
+        .limit(1)
+    )
+    etag = _weak_etag(
+        document.processing_status,
+        document.upload_time,
+        document.chunk_count,
+        first_chunk_id or ""
+    )
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return DocumentChunksResponse(
-        document_id=doc_id,
-        chunks=chunk_responses,
-        total_chunks=len(chunks)
+    chunk_models = _to_chunk_models(await db.run_sync(load_chunks_from_db, doc_id))
+    return _trusted_response(
+        DocumentChunksResponse.model_construct(
+            document_id=doc_id,
+            chunks=chunk_models,
+            total_chunks=len(chunk_models)
+        ),
+        headers={"ETag": etag}
     )
 
+# Below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 10_000
+
+async def _count_documents(db: AsyncSession) -> int:
+    """Document count, estimated from planner statistics on large Postgres tables"""
+    if db.get_bind().dialect.name == "postgresql":
+        # reltuples is -1 until the table is first analyzed
+        estimate = await db.scalar(
+            text("SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'documents'")
+        )
+        if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+    return await db.scalar(select(func.count()).select_from(DBDocument))
+
 @router.get("/documents", response_model=DocumentListResponse)
 async def list_documents(
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List documents from database"""
     try:
         # Query from database
-        documents = db.query(DBDocument).offset(skip).limit(limit).all()
-        total = db.query(DBDocument).count()
+        documents = (await db.scalars(select(DBDocument).offset(skip).limit(limit))).all()
+        total = await _count_documents(db)
         
         # Convert to response format
-        document_responses = [
-            DocumentResponse(
-                id=doc.id,
-                title=doc.title,
-                file_type=doc.file_type,
-                size=doc.file_size,
-                upload_time=doc.upload_time,
-                processing_status=doc.processing_status,
-                chunk_count=doc.chunk_count,
-                text_preview=doc.text_preview
-            )
-            for doc in documents
-        ]
+        document_responses = [_to_document_response(doc) for doc in documents]
         
-        return DocumentListResponse(
+        return _trusted_response(DocumentListResponse.model_construct(
             documents=document_responses,
             total=total,
             page=skip // limit + 1,
             limit=limit
-        )
+        ))
         
     except Exception as e:
         logger.error(f"List documents error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to list documents")
 
+@router.get("/documents/stream")
+async def stream_documents():
+    """Stream every document as NDJSON, one response object per line"""
+    async def generate():
+        # Own session: the response body outlives the request's dependencies
+        async with AsyncSessionLocal() as db:
+            documents = await db.stream_scalars(
+                select(DBDocument).order_by(DBDocument.upload_time).execution_options(yield_per=500)
+            )
+            async for doc in documents:
+                yield orjson.dumps(_to_document_response(doc).model_dump()) + b"\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# Most documents one batch request may ask for
+MAX_BATCH_DOCUMENTS = 500
+
+@router.post("/documents/batch")
+async def get_documents_batch(request: dict, db: AsyncSession = Depends(get_async_db)):
+    """Several documents, optionally with their chunks, keyed by ID (unknown IDs are omitted)"""
+    doc_ids = request.get("ids") or []
+    include_chunks = bool(request.get("include_chunks", False))
+    
+    if not isinstance(doc_ids, list):
+        raise HTTPException(status_code=400, detail="ids must be a list")
+    if len(doc_ids) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_DOCUMENTS} ids per request")
+    
+    documents = (await db.scalars(select(DBDocument).where(DBDocument.id.in_(doc_ids)))).all()
+    batch = {doc.id: _to_document_response(doc).model_dump() for doc in documents}
+    
+    # One chunk query for all documents, text loaded with the row
+    if include_chunks and batch:
+        for document in batch.values():
+            document["chunks"] = []
+        rows = await db.execute(
+            select(
+                DBChunk.id, DBChunk.document_id, DBChunk.chunk_index,
+                DBChunk.chunk_text, DBChunk.chunk_length, DBChunk.created_at
+            )
+            .where(DBChunk.document_id.in_(list(batch)))
+            .order_by(DBChunk.document_id, DBChunk.chunk_index)
+        )
+        for row in rows:
+            batch[row.document_id]["chunks"].append({
+                "id": row.id,
+                "index": row.chunk_index,
+                "text": row.chunk_text,
+                "length": row.chunk_length,
+                "created_at": row.created_at
+            })
+    
+    return ORJSONResponse(content=batch)
+
 @router.get("/documents/{doc_id}", response_model=DocumentResponse)
-async def get_document(doc_id: str):
+async def get_document(
+    doc_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get specific document endpoint"""
-    if doc_id not in documents_store:
+    db_document = await db.get(DBDocument, doc_id)
+    if not db_document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    return documents_store[doc_id]["document"]
+    document = _to_document_response(db_document)
+    etag = _weak_etag(document.processing_status, document.chunk_count, document.upload_time)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
+    return document
 
 @router.delete("/documents/{doc_id}", response_model=BaseResponse)
-async def delete_document(doc_id: str):
+async def delete_document(doc_id: str, db: AsyncSession = Depends(get_async_db)):
     """Delete document endpoint"""
-    if doc_id not in documents_store:
+    db_document = await db.get(DBDocument, doc_id)
+    if not db_document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        # Remove file
-        import os
-        file_path = documents_store[doc_id]["file_path"]
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Remove from store
-        del documents_store[doc_id]
+        # Remove from database in one transaction (chunks first, no lazy
+        # cascade in async sessions)
+        await db.execute(delete(DBChunk).where(DBChunk.document_id == doc_id))
+        await db.execute(delete(DBDocument).where(DBDocument.id == doc_id))
+        await db.commit()
+        
+        # Remove file, its extracted text and its vectors
+        for path in (db_document.file_path, get_text_cache_path(db_document.file_path)):
+            try:
+                await aios.remove(path)
+            except FileNotFoundError:
+                pass
+        await asyncio.to_thread(vector_store.delete_document, doc_id)
         
         return BaseResponse(message="Document deleted successfully")
         
@@ -336,48 +468,72 @@ async def delete_document(doc_id: str):
         logger.error(f"Delete error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to delete document")
 
-# System endpoints
+@router.get("/jobs/{task_id}")
+async def get_job_status(task_id: str):
+    """Get background processing job status"""
+    result = AsyncResult(task_id, app=celery_app)
+    
+    return {
+        "task_id": task_id,
+        "state": result.state,
+        "result": result.result if result.successful() else None,
+        "error": str(result.info) if result.failed() else None
+    }
+
+# System endpoints: configuration is fixed at startup, so these responses are
+# serialized once and served as-is
+STATIC_RESPONSE_HEADERS = {"Cache-Control": "public, max-age=60"}
+
+_SYSTEM_INFO_JSON = orjson.dumps({
+    "app_name": settings.app_name,
+    "version": settings.app_version,
+    "debug": settings.debug
+})
+
+_SYSTEM_MODELS_JSON = orjson.dumps({
+    "embedding_model": settings.embedding_model,
+    "llm_model": settings.ollama_model,
+    "status": "not_loaded"
+})
+
+def _static_json(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json", headers=STATIC_RESPONSE_HEADERS)
+
 @router.get("/system/info")
 async def get_system_info():
     """Get system information"""
-    return {
-        "app_name": settings.app_name,
-        "version": settings.app_version,
-        "debug": settings.debug,
-        "timestamp": datetime.now().isoformat()
-    }
+    return _static_json(_SYSTEM_INFO_JSON)
+
+@router.get("/system/time")
+async def get_system_time():
+    """Get server time"""
+    return {"timestamp": now_cached().isoformat()}
 
 @router.get("/system/models")
 async def get_available_models():
     """Get available AI models"""
-    return {
-        "embedding_model": settings.embedding_model,
-        "llm_model": settings.ollama_model,
-        "status": "not_loaded"
-    }
+    return _static_json(_SYSTEM_MODELS_JSON)
 
 @router.post("/documents/{doc_id}/embeddings", response_model=EmbeddingResponse)
-async def generate_embeddings(doc_id: str):
+async def generate_embeddings(doc_id: str, db: AsyncSession = Depends(get_async_db)):
     """Generate embeddings for document chunks"""
-    if doc_id not in documents_store:
+    if not await db.scalar(select(DBDocument.id).where(DBDocument.id == doc_id)):
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        doc_data = documents_store[doc_id]
-        chunks = doc_data.get("chunks", [])
+        chunks = await db.run_sync(load_chunks_from_db, doc_id)
         
         if not chunks:
             raise HTTPException(status_code=400, detail="Document not chunked yet")
         
-        # Generate embeddings
-        chunks_with_embeddings = process_document_with_embeddings(doc_id, chunks)
+        # Generate embeddings (batched with concurrent requests)
+        chunks_with_embeddings = await embed_document_chunks(doc_id, chunks)
         
-        # Update storage
-        doc_data["chunks"] = chunks_with_embeddings
-        doc_data["document"].processing_status = "embedded"
+        # Keep embeddings on the chunk rows until they are stored in Qdrant
+        await db.run_sync(save_chunk_embeddings, chunks_with_embeddings)
+        await db.run_sync(update_document_status, doc_id, "embedded")
         
         # Get embedding dimension
-        from embedding import embedding_engine
         embedding_dim = embedding_engine.get_embedding_dimension()
         
         logger.info(f"Embeddings generated for document: {doc_id}")
@@ -397,27 +553,26 @@ async def generate_embeddings(doc_id: str):
 
 
 @router.post("/documents/{doc_id}/store", response_model=BaseResponse)
-async def store_document_vectors(doc_id: str):
+async def store_document_vectors(doc_id: str, db: AsyncSession = Depends(get_async_db)):
     """Store document embeddings in vector database"""
-    if doc_id not in documents_store:
+    if not await db.scalar(select(DBDocument.id).where(DBDocument.id == doc_id)):
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        doc_data = documents_store[doc_id]
-        chunks = doc_data.get("chunks", [])
+        chunks = await db.run_sync(load_chunks_from_db, doc_id, True)
         
         if not chunks:
             raise HTTPException(status_code=400, detail="No chunks found")
         
         # Check if embeddings exist
-        if not chunks[0].get("embedding"):
+        if chunks[0].get("embedding") is None:
             raise HTTPException(status_code=400, detail="No embeddings found. Generate embeddings first")
         
         # Store in Qdrant
-        stored_count = vector_store.store_embeddings(doc_id, chunks)
+        stored_count = await asyncio.to_thread(vector_store.store_embeddings, doc_id, chunks)
         
         # Update document status
-        doc_data["document"].processing_status = "stored"
+        await db.run_sync(update_document_status, doc_id, "stored")
         
         logger.info(f"Vectors stored for document: {doc_id}")
         
@@ -440,12 +595,12 @@ async def semantic_search(request: dict):
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Generate query embedding - Fix the import
-        from embedding import embedding_engine
-        query_embedding = embedding_engine.embed_single_text(query)
+        # Generate query embedding, batched with concurrent queries
+        query_embedding = await embed_query_batched(query)
         
-        # Search vectors
-        results = vector_store.search_similar(
+        # Search vectors off the event loop
+        results = await asyncio.to_thread(
+            vector_store.search_similar,
             query_vector=query_embedding,
             limit=limit,
             doc_filter=document_id
@@ -485,11 +640,15 @@ async def rag_query(request: dict):
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Retrieve context
-        context = rag_pipeline.retrieve_context(
+        query_embedding = await embed_query_batched(query)
+        
+        # Retrieve context off the event loop (DB and Qdrant calls)
+        context = await asyncio.to_thread(
+            rag_pipeline.retrieve_context,
             query=query,
             max_results=max_results,
-            max_context_length=max_context_length
+            max_context_length=max_context_length,
+            query_embedding=query_embedding
         )
         
         # Build prompt
@@ -509,7 +668,7 @@ async def rag_query(request: dict):
 
 
 
-@router.post("/llm/generate")
+@router.post("/llm/generate", dependencies=[Depends(require_ollama)])
 async def generate_llm_response(request: dict):
     """Generate LLM response"""
     try:
@@ -517,10 +676,6 @@ async def generate_llm_response(request: dict):
         if not prompt:
             raise HTTPException(status_code=400, detail="Prompt is required")
         
-        # Check if Ollama is available
-        if not await ollama_client.is_available():
-            raise HTTPException(status_code=503, detail="Ollama service unavailable")
-        
         response = await ollama_client.generate_response(prompt)
         
         return {
@@ -533,7 +688,7 @@ async def generate_llm_response(request: dict):
         logger.error(f"LLM generation error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="LLM generation failed")
 
-@router.post("/rag/answer")
+@router.post("/rag/answer", dependencies=[Depends(require_ollama)])
 async def rag_answer(request: dict):
     """Complete RAG pipeline with answer generation"""
     try:
@@ -543,10 +698,6 @@ async def rag_answer(request: dict):
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Check if Ollama is available
-        if not await ollama_client.is_available():
-            raise HTTPException(status_code=503, detail="Ollama service unavailable")
-        
         result = await rag_pipeline.generate_answer(query, max_results)
         return result
         
@@ -554,7 +705,51 @@ async def rag_answer(request: dict):
         logger.error(f"RAG answer error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="RAG answer failed")
 
-@router.post("/rag/stream")
+async def _coalesce_tokens(tokens: AsyncGenerator[str, None], frame_size: int = 64) -> AsyncIterator[str]:
+    """Merge tokens that queue up while the client is slow into ~frame_size frames"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    
+    async def produce():
+        try:
+            async for token in tokens:
+                await queue.put(token)
+        except asyncio.CancelledError:
+            # Only the consumer cancels, and it no longer reads the queue;
+            # waiting to put the sentinel on a full queue would never return
+            raise
+        except Exception:
+            await queue.put(None)
+            raise
+        else:
+            await queue.put(None)
+        finally:
+            # Closes the upstream LLM stream when the client goes away
+            await tokens.aclose()
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            # Never wait for more tokens, only take the ones already queued
+            frame = [token]
+            size = len(token)
+            while size < frame_size and not queue.empty():
+                token = queue.get_nowait()
+                if token is None:
+                    break
+                frame.append(token)
+                size += len(token)
+            yield "".join(frame)
+            if token is None:
+                break
+        # Re-raises a failure of the token stream
+        await producer
+    finally:
+        producer.cancel()
+
+@router.post("/rag/stream", dependencies=[Depends(require_ollama)])
 async def rag_stream_answer(request: dict):
     """Stream RAG answer"""
     try:
@@ -564,19 +759,20 @@ async def rag_stream_answer(request: dict):
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Check if Ollama is available
-        if not await ollama_client.is_available():
-            raise HTTPException(status_code=503, detail="Ollama service unavailable")
-        
         async def generate():
-            async for chunk in rag_pipeline.stream_answer(query, max_results):
-                yield f"data: {chunk}\n\n"
-            yield "data: [DONE]\n\n"
+            async for frame in _coalesce_tokens(rag_pipeline.stream_answer(query, max_results)):
+                # Newlines inside a frame continue it as further data lines
+                yield b"data: " + frame.encode("utf-8").replace(b"\n", b"\ndata: ") + b"\n\n"
+            yield b"data: [DONE]\n\n"
         
         return StreamingResponse(
             generate(),
-            media_type="text/plain",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
+            }
         )
         
     except Exception as e:
@@ -595,7 +791,7 @@ async def llm_status():
         "status": "ready" if ollama_available else "unavailable"
     }
 
-@router.post("/rag/answer-with-fallback")
+@router.post("/rag/answer-with-fallback", dependencies=[Depends(require_ollama)])
 async def rag_answer_with_fallback(request: dict):
     """RAG with web search fallback"""
     try:
@@ -606,10 +802,6 @@ async def rag_answer_with_fallback(request: dict):
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Check if Ollama is available
-        if not await ollama_client.is_available():
-            raise HTTPException(status_code=503, detail="Ollama service unavailable")
-        
         result = await rag_pipeline.generate_answer_with_fallback(
             query, max_results, use_fallback
         )
@@ -632,7 +824,9 @@ async def web_search_endpoint(request: dict):
         if not web_search.is_available():
             raise HTTPException(status_code=503, detail="Web search not available")
         
-        results = await web_search.search(query, max_results)
+        # The query embedding lets paraphrased searches reuse cached results
+        query_embedding = await embed_query_batched(query)
+        results = await web_search.search(query, max_results, query_embedding)
         
         return {
             "query": query,
@@ -644,26 +838,34 @@ async def web_search_endpoint(request: dict):
         logger.error(f"Web search error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Web search failed")
 
-# REPLACE the search_capabilities function with:
-@router.get("/search/capabilities")
-async def search_capabilities():
-    """Get search capabilities"""
+# Web search availability can change at runtime (key loaded later), so
+# the payload is rebuilt at most every 30 seconds rather than frozen at import
+@ttl_cache(ttl=30)
+async def _search_capabilities_json() -> bytes:
     try:
         web_available = web_search.is_available()
     except:
         web_available = False
         
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    tavily_key = os.getenv("TAVILY_API_KEY", "")
+    # Settings already parsed .env at startup
+    tavily_key = settings.tavily_api_key
     
-    return {
+    return orjson.dumps({
         "local_search": True,
         "web_search": web_available,
         "fallback_enabled": web_available,
         "tavily_configured": bool(tavily_key)
-    }
+    })
+
+@router.get("/search/capabilities")
+async def search_capabilities():
+    """Get search capabilities"""
+    # Clients may cache it only as long as the server does
+    return Response(
+        content=await _search_capabilities_json(),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=30"}
+    )
 
 # Authentication routes
 @router.post("/auth/google/login")
@@ -0,0 +1,71 @@
+import functools
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+def ttl_cache(ttl: float):
+    """Cache an async function's result per argument set for ttl seconds"""
+    def decorator(func):
+        entries: Dict[Any, Tuple[float, Any]] = {}
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            cached = entries.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+
+            value = await func(*args, **kwargs)
+            entries[key] = (now + ttl, value)
+            return value
+
+        return wrapper
+    return decorator
+
+class SemanticCache:
+    """Recent query results, reused when a new query's embedding is nearly identical"""
+
+    def __init__(self, size: int = 256, threshold: float = 0.95, ttl: float = 300.0, enabled: bool = True):
+        self.size = size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.enabled = enabled and size > 0
+        self._vectors: Optional[np.ndarray] = None  # allocated once the dimension is known
+        self._expires = np.full(size, -np.inf)
+        self._keys: List[Hashable] = [None] * size
+        self._values: List[Any] = [None] * size
+        self._next = 0  # ring buffer slot written next
+        self._lock = threading.Lock()
+
+    def get(self, vector: np.ndarray, key: Hashable) -> Optional[Any]:
+        """Cached value for the most similar live query with the same key"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._vectors is None:
+                return None
+            # Query vectors are unit length, so the dot product is the cosine
+            sims = self._vectors @ vector
+            sims[self._expires <= time.monotonic()] = -np.inf
+            # Keys are compared only for the few slots above the threshold, best first
+            close = np.flatnonzero(sims >= self.threshold)
+            for slot in close[np.argsort(sims[close])[::-1]]:
+                if self._keys[slot] == key:
+                    return self._values[slot]
+            return None
+
+    def put(self, vector: np.ndarray, key: Hashable, value: Any):
+        """Store a value, overwriting the oldest slot when full"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.size, len(vector)), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = vector
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._keys[slot] = key
+            self._values[slot] = value
+            self._next = (slot + 1) % self.size
@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, JSON, Boolean, Float, ForeignKey
+from alembic import command as alembic_command
+from alembic.config import Config as AlembicConfig
+from sqlalchemy import create_engine, event, inspect, Column, String, Integer, DateTime, Text, JSON, Boolean, Float, ForeignKey, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session, relationship, deferred
 from sqlalchemy.sql import func
-from typing import Generator
+from typing import AsyncGenerator, Generator
+import os
 import uuid
 from datetime import datetime
 
@@ -37,7 +41,7 @@ class Document(Base):
     processing_status = Column(String, default="uploaded")
     chunk_count = Column(Integer, default=0)
     text_preview = Column(Text, nullable=True)
-    file_hash = Column(String, nullable=True)
+    file_hash = Column(String, nullable=True, index=True)
     owner_id = Column(String, ForeignKey("users.id"), nullable=False)
     
     # Relationships
@@ -50,9 +54,11 @@ class DocumentChunk(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    chunk_text = Column(Text, nullable=False)
+    # Large columns load only when asked for (see load_chunks_from_db)
+    chunk_text = deferred(Column(Text, nullable=False))
     chunk_length = Column(Integer, nullable=False)
     embedding_id = Column(String, nullable=True)  # Qdrant point ID
+    embedding = deferred(Column(LargeBinary, nullable=True))  # float32 vector bytes
     created_at = Column(DateTime, default=func.now())
     chunk_metadata = Column(JSON, default=dict)  # Changed from metadata
     
@@ -96,12 +102,67 @@ class SystemMetrics(Base):
     metric_metadata = Column(JSON, default=dict)  # Changed from metadata
 
 # Database connection
-engine = create_engine(settings.database_url, echo=settings.debug)
+_is_sqlite = settings.database_url.startswith("sqlite")
+
+def _engine_options() -> dict:
+    """Engine options tuned for bulk chunk writes"""
+    options = {"echo": settings.sql_echo, "insertmanyvalues_page_size": 10000}
+    if _is_sqlite:
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options.update(pool_size=20, max_overflow=40, pool_pre_ping=True)
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL journal and larger in-memory caches for each SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "cache_size=-64000",
+        "mmap_size=268435456",
+    ):
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+engine = create_engine(settings.database_url, **_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_database_url(url: str) -> str:
+    """Same database through an async driver"""
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+# Async engine for request handlers; background jobs keep the sync engine
+async_engine = create_async_engine(_async_database_url(settings.database_url), **_engine_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if _is_sqlite:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+def _alembic_config() -> AlembicConfig:
+    """Alembic config for the migrations shipped next to this module"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    config = AlembicConfig(os.path.join(backend_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(backend_dir, "migrations"))
+    config.attributes["configure_logger"] = False
+    return config
+
 def create_tables():
-    """Create all database tables"""
+    """Create all database tables, migrating existing ones to the current schema"""
+    config = _alembic_config()
+    fresh = not inspect(engine).has_table(Document.__tablename__)
     Base.metadata.create_all(bind=engine)
+    if fresh:
+        # create_all just built the current schema; record it as migrated
+        alembic_command.stamp(config, "head")
+    else:
+        alembic_command.upgrade(config, "head")
 
 def get_db() -> Generator[Session, None, None]:
     """Get database session"""
@@ -111,6 +172,11 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_database():
     """Initialize database"""
     try:
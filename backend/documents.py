@@ -1,19 +1,49 @@
 import logging
+import os
+import re
+from bisect import bisect_left, bisect_right
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
 import uuid
 from datetime import datetime
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import undefer
 
 # Text extraction imports
-import PyPDF2
+import fitz  # PyMuPDF
+import pypdfium2 as pdfium
 from docx import Document as DocxDocument
-import markdown
+from markdown_it import MarkdownIt
 
-from utils import get_file_hash
+from config import settings
+from utils import get_file_hash, iter_quality_chunks
 from schemas import DocumentResponse
 
 logger = logging.getLogger(__name__)
 
+# Runs of whitespace and disallowed characters, collapsed to one space in one pass
+_CLEAN_RE = re.compile(r'[^\w\.,!?;:()\-\'""]+')
+
+# End of a sentence: a run of terminators followed by a space or the end of text
+_SENTENCE_END_RE = re.compile(r'[.!?]+(?= |$)')
+
+# Markdown parser shared by all extractions; only text-bearing tokens are kept
+_MARKDOWN = MarkdownIt()
+_MARKDOWN_TEXT_TOKENS = {"text", "code_inline", "image", "softbreak", "hardbreak"}
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+
+def _pdfium_page_text(pdf, index: int) -> str:
+    """Extract one page's text with pypdfium2, releasing its native handles"""
+    page = pdf[index]
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range()
+    finally:
+        textpage.close()
+        page.close()
+
 class DocumentProcessor:
     def __init__(self):
         self.supported_types = ["pdf", "docx", "txt", "md"]
@@ -35,23 +65,75 @@ class DocumentProcessor:
             logger.error(f"Text extraction failed for {file_path}: {e}")
             raise
     
+    def iter_pages(self, file_path: str, file_type: str) -> Iterator[str]:
+        """Yield document text page by page (whole text for non-PDF files)"""
+        if file_type == "pdf":
+            yield from self._iter_pdf_pages(file_path)
+        else:
+            yield self.extract_text(file_path, file_type)
+    
     def _extract_pdf_text(self, file_path: str) -> str:
         """Extract text from PDF file"""
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+        if settings.pdf_backend == "pymupdf":
+            return self._extract_pdf_text_pymupdf(file_path)
+        return self._extract_pdf_text_pdfium(file_path)
+    
+    def _iter_pdf_pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Yield text of PDF pages [start, stop) with the configured backend"""
+        if settings.pdf_backend == "pymupdf":
+            return self._iter_pdf_pages_pymupdf(file_path, start, stop)
+        return self._iter_pdf_pages_pdfium(file_path, start, stop)
+    
+    def pdf_page_count(self, file_path: str) -> int:
+        """Number of pages in a PDF, read with the configured backend"""
+        if settings.pdf_backend == "pymupdf":
+            with fitz.open(file_path) as pdf:
+                return pdf.page_count
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    
+    def _extract_pdf_text_pymupdf(self, file_path: str) -> str:
+        """Extract text from PDF file with PyMuPDF"""
+        return "\n".join(self._iter_pdf_pages_pymupdf(file_path)).strip()
+    
+    def _iter_pdf_pages_pymupdf(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Yield PDF page text with PyMuPDF, retrying empty pages with pdfium"""
+        fallback = None
+        try:
+            with fitz.open(file_path) as pdf:
+                for i in range(start, pdf.page_count if stop is None else stop):
+                    page_text = pdf[i].get_text("text")
+                    if not page_text.strip():
+                        # Only opened when a page needs it
+                        if fallback is None:
+                            fallback = pdfium.PdfDocument(file_path)
+                        page_text = _pdfium_page_text(fallback, i)
+                    yield page_text
+        finally:
+            if fallback is not None:
+                fallback.close()
+    
+    def _extract_pdf_text_pdfium(self, file_path: str) -> str:
+        """Extract text from PDF file with pypdfium2"""
+        return "\n".join(self._iter_pdf_pages_pdfium(file_path)).strip()
+    
+    def _iter_pdf_pages_pdfium(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Yield PDF page text with pypdfium2"""
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for i in range(start, len(pdf) if stop is None else stop):
+                yield _pdfium_page_text(pdf, i)
+        finally:
+            pdf.close()
     
     def _extract_docx_text(self, file_path: str) -> str:
         """Extract text from DOCX file"""
         doc = DocxDocument(file_path)
-        text = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text.append(paragraph.text)
-        return "\n".join(text)
+        # paragraph.text walks the XML, so it is read once per paragraph
+        return "\n".join(text for paragraph in doc.paragraphs if (text := paragraph.text).strip())
     
     def _extract_txt_text(self, file_path: str) -> str:
         """Extract text from TXT file"""
@@ -61,104 +143,121 @@ class DocumentProcessor:
     def _extract_markdown_text(self, file_path: str) -> str:
         """Extract text from Markdown file"""
         with open(file_path, 'r', encoding='utf-8') as file:
-            md_content = file.read()
-            # Convert to plain text (remove markdown formatting)
-            html = markdown.markdown(md_content)
-            import re
-            text = re.sub('<[^<]+?>', '', html)
-            return text
+            tokens = _MARKDOWN.parse(file.read())
+        
+        # Collect text straight from the token stream instead of rendering
+        # HTML and stripping the tags again
+        blocks = []
+        for token in tokens:
+            if token.type == "inline":
+                blocks.append("".join(
+                    "\n" if child.type in ("softbreak", "hardbreak") else child.content
+                    for child in token.children
+                    if child.type in _MARKDOWN_TEXT_TOKENS
+                ))
+            elif token.type in ("fence", "code_block"):
+                blocks.append(token.content)
+            elif token.type == "html_block":
+                # Keep the text of raw HTML blocks, as the old HTML strip did
+                blocks.append(_HTML_TAG_RE.sub('', token.content))
+        return "\n".join(blocks)
     
     def chunk_document(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[Dict[str, Any]]:
         """Chunk document text into smaller pieces"""
-        if not text.strip():
-            return []
-        
-        # Clean and normalize text
-        text = self._clean_text(text)
-        
-        # Use adaptive chunking
-        chunks = self._adaptive_chunk(text, chunk_size, overlap)
+        return list(self.chunk_stream([text], chunk_size, overlap))
+    
+    def chunk_stream(self, pages: Iterable[str], chunk_size: int = 1000, overlap: int = 100) -> Iterator[Dict[str, Any]]:
+        """Chunk text arriving page by page without holding the whole document"""
+        # Clean and normalize each page; page breaks count as whitespace
+        cleaned_pages = (cleaned for cleaned in map(self._clean_text, pages) if cleaned)
         
-        # Create chunk objects with metadata
-        chunk_objects = []
-        for i, chunk_text in enumerate(chunks):
-            chunk_objects.append({
+        # Use adaptive chunking and create chunk objects with metadata
+        for i, chunk_text in enumerate(self._adaptive_chunk(cleaned_pages, chunk_size, overlap)):
+            yield {
                 "id": str(uuid.uuid4()),
                 "index": i,
                 "text": chunk_text,
                 "length": len(chunk_text),
                 "created_at": datetime.now()
-            })
-        
-        return chunk_objects
+            }
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text"""
-        import re
-        
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove special characters but keep punctuation
-        text = re.sub(r'[^\w\s\.,!?;:()\-\'""]', ' ', text)
-        
-        # Remove multiple spaces
-        text = re.sub(r' +', ' ', text)
-        
-        return text.strip()
+        # Collapse whitespace and special characters (keeping punctuation)
+        return _CLEAN_RE.sub(' ', text).strip()
     
-    def _adaptive_chunk(self, text: str, target_size: int, overlap: int) -> List[str]:
-        """Adaptive chunking that respects sentence boundaries"""
-        if len(text) <= target_size:
-            return [text]
-        
-        # Split into sentences
-        sentences = self._split_sentences(text)
-        chunks = []
-        current_chunk = ""
+    def _adaptive_chunk(self, pages: Iterable[str], target_size: int, overlap: int) -> Iterator[str]:
+        """Sentence-aligned sliding window over the text, tracked by offsets"""
+        pages = iter(pages)
+        text = ""
+        ends: List[int] = []
+        lo = 0       # start of the next chunk
+        emitted = 0  # end of the last chunk yielded
+        exhausted = False
         
-        for sentence in sentences:
-            # If adding this sentence would exceed target size
-            if len(current_chunk) + len(sentence) > target_size and current_chunk:
-                chunks.append(current_chunk.strip())
-                
-                # Start new chunk with overlap
-                overlap_text = self._get_overlap_text(current_chunk, overlap)
-                current_chunk = overlap_text + " " + sentence
+        while True:
+            # Keep slightly more than one window buffered; text before the
+            # next chunk start is dropped so the buffer never holds the document
+            if not exhausted and len(text) - lo <= target_size:
+                # Pages are collected as parts and joined once, so small
+                # pages don't recopy the buffer on every append
+                carried = len(text) - lo
+                parts = [text[lo:]] if carried else []
+                size = carried
+                # Sentence ends already found in the carried-over text are
+                # shifted, not rescanned; the joining space keeps them valid
+                ends = [end - lo for end in ends if end > lo]
+                while size <= target_size:
+                    page = next(pages, None)
+                    if page is None:
+                        exhausted = True
+                        break
+                    size += len(page) + (1 if parts else 0)
+                    parts.append(page)
+                text = " ".join(parts)
+                emitted = max(emitted - lo, 0)
+                lo = 0
+                # Each sentence end is found once and bisected below
+                ends.extend(match.end() for match in _SENTENCE_END_RE.finditer(text, carried))
+            
+            # The remainder fits in one window: emit it unless it's all overlap
+            if len(text) - lo <= target_size:
+                if len(text) > emitted and text[lo:].strip():
+                    yield text[lo:].strip()
+                return
+            
+            # End at the last sentence end inside the window, else at a word
+            # boundary, else cut hard; always past the last chunk's end, so
+            # every chunk adds text beyond its overlap
+            limit = lo + target_size
+            floor = max(lo, emitted)
+            i = bisect_right(ends, limit) - 1
+            if i >= 0 and ends[i] > floor:
+                hi = ends[i]
             else:
-                current_chunk += " " + sentence if current_chunk else sentence
-        
-        # Add the last chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        return chunks
-    
-    def _split_sentences(self, text: str) -> List[str]:
-        """Split text into sentences"""
-        import re
-        
-        # Simple sentence splitting (can be improved with NLTK)
-        sentences = re.split(r'[.!?]+', text)
-        return [s.strip() for s in sentences if s.strip()]
-    
-    def _get_overlap_text(self, text: str, overlap_size: int) -> str:
-        """Get overlap text from the end of current chunk"""
-        if len(text) <= overlap_size:
-            return text
-        
-        # Try to get overlap at word boundary
-        overlap_text = text[-overlap_size:]
-        space_index = overlap_text.find(' ')
-        if space_index > 0:
-            return overlap_text[space_index:].strip()
-        
-        return overlap_text
+                space = text.rfind(" ", floor + 1, limit)
+                hi = space if space > floor else limit
+            
+            yield text[lo:hi].strip()
+            emitted = hi
+            
+            # Start the next chunk overlap characters back (but after this
+            # chunk's start), snapped forward to a sentence start, else a word start
+            next_lo = hi
+            if overlap > 0:
+                target = max(hi - overlap, lo + 1)
+                j = bisect_left(ends, target)
+                if j < len(ends) and ends[j] < hi:
+                    next_lo = ends[j]
+                else:
+                    space = text.find(" ", target, hi)
+                    next_lo = space if space != -1 else target
+            lo = next_lo if next_lo > lo else hi
 
 def process_document_with_embeddings(doc_id: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Process chunks and generate embeddings"""
     try:
-        from .embeddings import embedding_engine
+        from embedding import embedding_engine
         
         # Extract text from chunks
         chunk_texts = [chunk["text"] for chunk in chunks]
@@ -179,7 +278,24 @@ def process_document_with_embeddings(doc_id: str, chunks: List[Dict[str, Any]])
         logger.error(f"Embedding generation failed: {e}")
         raise
 
+async def embed_document_chunks(doc_id: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Generate embeddings for chunks, batched with concurrent requests"""
+    from embedding import embedding_batcher
+    
+    logger.info(f"Queueing {len(chunks)} chunks for batched embedding")
+    embeddings = await embedding_batcher.embed([chunk["text"] for chunk in chunks])
+    
+    for chunk, embedding in zip(chunks, embeddings):
+        chunk["embedding"] = embedding
+        chunk["embedding_dim"] = len(embedding)
+    
+    logger.info(f"Embeddings generated successfully for document: {doc_id}")
+    return chunks
+
 # Database functions
+# Users known to exist, so uploads skip the lookup after the first one
+_known_users: Set[str] = set()
+
 def save_document_to_db(
     db,
     doc_id: str,
@@ -188,24 +304,42 @@ def save_document_to_db(
     file_type: str,
     file_size: int,
     text_preview: str,
-    user_id: str = "default_user"
+    user_id: str = "default_user",
+    processing_status: str = "extracted",
+    file_hash: Optional[str] = None
 ):
-    """Save document metadata to database"""
+    """Save document metadata to database, returning the existing row for a duplicate file"""
     try:
         from database import Document as DBDocument, User as DBUser
         
-        # Create or get user
-        user = db.query(DBUser).filter(DBUser.id == user_id).first()
-        if not user:
-            user = DBUser(
-                id=user_id,
-                email=f"{user_id}@localhost",
-                name="Default User"
-            )
-            db.add(user)
-            db.commit()
+        # Create the user on first use; it is committed together with the document
+        if user_id not in _known_users:
+            user = db.query(DBUser).filter(DBUser.id == user_id).first()
+            if not user:
+                user = DBUser(
+                    id=user_id,
+                    email=f"{user_id}@localhost",
+                    name="Default User"
+                )
+                db.add(user)
+        
+        if file_hash is None:
+            file_hash = get_file_hash(file_path)
         
-        file_hash = get_file_hash(file_path)
+        # Identical content already uploaded by this user: reuse it instead
+        # of extracting, chunking and embedding it again
+        existing = (
+            db.query(DBDocument)
+            .filter(
+                DBDocument.owner_id == user_id,
+                DBDocument.file_hash == file_hash,
+                DBDocument.processing_status != "failed"
+            )
+            .first()
+        )
+        if existing:
+            _known_users.add(user_id)
+            return existing
         
         db_document = DBDocument(
             id=doc_id,
@@ -216,46 +350,118 @@ def save_document_to_db(
             text_preview=text_preview,
             file_hash=file_hash,
             owner_id=user_id,
-            processing_status="extracted"
+            processing_status=processing_status
         )
         
         db.add(db_document)
         db.commit()
         db.refresh(db_document)
+        _known_users.add(user_id)
         
         return db_document
     except Exception as e:
         logger.error(f"Database save failed: {e}")
         raise
 
-def save_chunks_to_db(db, doc_id: str, chunks: List[Dict[str, Any]]):
-    """Save document chunks to database"""
+def save_chunks_to_db(db, doc_id: str, chunks: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+    """Replace document chunks in database, inserting batch_size rows at a time"""
     try:
         from database import DocumentChunk as DBChunk
         
-        db_chunks = []
+        # Re-processing regenerates every chunk, so drop the previous set
+        db.query(DBChunk).filter(DBChunk.document_id == doc_id).delete()
         
-        for chunk in chunks:
-            db_chunk = DBChunk(
-                id=chunk["id"],
-                document_id=doc_id,
-                chunk_index=chunk["index"],
-                chunk_text=chunk["text"],
-                chunk_length=chunk["length"],
-                embedding_id=chunk["id"],  # Use same ID for Qdrant
-                metadata={"created_at": chunk["created_at"].isoformat()}
-            )
-            db_chunks.append(db_chunk)
+        # One Core insert per slice (insertmanyvalues) instead of ORM
+        # bookkeeping per chunk; a chunk generator is consumed one slice at a time
+        insert_chunks = insert(DBChunk)
+        chunks = iter(chunks)
+        count = 0
+        while batch := list(islice(chunks, batch_size)):
+            rows = [
+                {
+                    "id": chunk["id"],
+                    "document_id": doc_id,
+                    "chunk_index": chunk["index"],
+                    "chunk_text": chunk["text"],
+                    "chunk_length": chunk["length"],
+                    "embedding_id": chunk["id"],  # Use same ID for Qdrant
+                    "created_at": chunk["created_at"],
+                    "chunk_metadata": {"created_at": chunk["created_at"].isoformat()}
+                }
+                for chunk in batch
+            ]
+            db.execute(insert_chunks, rows)
+            count += len(rows)
         
-        db.add_all(db_chunks)
         db.commit()
-        
-        return db_chunks
+        return count
     except Exception as e:
         logger.error(f"Chunks save failed: {e}")
+        # Keep the previous chunks and leave the session usable for the caller
+        db.rollback()
+        raise
+
+def load_chunks_from_db(db, doc_id: str, with_embeddings: bool = False) -> List[Dict[str, Any]]:
+    """Load document chunks from database in index order"""
+    from database import DocumentChunk as DBChunk
+    
+    # Text and embeddings are deferred columns; load them in the same query
+    options = [undefer(DBChunk.chunk_text)]
+    if with_embeddings:
+        options.append(undefer(DBChunk.embedding))
+    rows = (
+        db.query(DBChunk)
+        .options(*options)
+        .filter(DBChunk.document_id == doc_id)
+        .order_by(DBChunk.chunk_index)
+        .all()
+    )
+    
+    chunks = []
+    for row in rows:
+        chunk = {
+            "id": row.id,
+            "index": row.chunk_index,
+            "text": row.chunk_text,
+            "length": row.chunk_length,
+            "created_at": row.created_at
+        }
+        if with_embeddings and row.embedding is not None:
+            chunk["embedding"] = _unpack_embedding(row.embedding)
+            chunk["embedding_dim"] = len(chunk["embedding"])
+        chunks.append(chunk)
+    
+    return chunks
+
+def _pack_embeddings(embeddings: np.ndarray) -> List[bytes]:
+    """Pack each vector as raw float32 bytes"""
+    # Kept exact: these become Qdrant's originals, which its int8 search rescores against
+    embeddings = embeddings.astype(np.float32, copy=False)
+    return [vector.tobytes() for vector in embeddings]
+
+def _unpack_embedding(packed: bytes) -> np.ndarray:
+    """Unpack a vector stored by _pack_embeddings"""
+    return np.frombuffer(packed, dtype=np.float32)
+
+def save_chunk_embeddings(db, chunks: List[Dict[str, Any]]):
+    """Store chunk embeddings on their database rows"""
+    try:
+        from database import DocumentChunk as DBChunk
+        
+        if not chunks:
+            return
+        
+        embeddings = np.vstack([chunk["embedding"] for chunk in chunks])
+        db.bulk_update_mappings(DBChunk, [
+            {"id": chunk["id"], "embedding": packed}
+            for chunk, packed in zip(chunks, _pack_embeddings(embeddings))
+        ])
+        db.commit()
+    except Exception as e:
+        logger.error(f"Embeddings save failed: {e}")
         raise
 
-def update_document_status(db, doc_id: str, status: str, chunk_count: int = None):
+def update_document_status(db, doc_id: str, status: str, chunk_count: int = None, text_preview: str = None):
     """Update document processing status"""
     try:
         from database import Document as DBDocument
@@ -265,9 +471,69 @@ def update_document_status(db, doc_id: str, status: str, chunk_count: int = None
             document.processing_status = status
             if chunk_count is not None:
                 document.chunk_count = chunk_count
+            if text_preview is not None:
+                document.text_preview = text_preview
             db.commit()
     except Exception as e:
         logger.error(f"Status update failed: {e}")
 
+def get_text_cache_path(file_path: str) -> str:
+    """Path of the extracted-text file kept next to an upload"""
+    return f"{file_path}.txt"
+
+def pdf_page_count(file_path: str) -> int:
+    """Count a PDF's pages in a worker process"""
+    return document_processor.pdf_page_count(file_path)
+
+def pdf_page_ranges(page_count: int, max_workers: int, pages_per_worker: int = 20) -> List[Tuple[int, int]]:
+    """Split page_count pages into contiguous ranges, one per worker"""
+    # Small documents stay in a single range
+    workers = max(1, min(max_workers, page_count // pages_per_worker + 1))
+    step = -(-page_count // workers) or 1
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract text of PDF pages [start, stop) in a worker process"""
+    return list(document_processor._iter_pdf_pages(file_path, start, stop))
+
+def extract_text_to_cache(file_path: str, file_type: str, pages: Optional[Iterable[str]] = None) -> str:
+    """Write extracted text next to the upload page by page and return its preview"""
+    cache_path = get_text_cache_path(file_path)
+    if not os.path.exists(cache_path):
+        # Written under a unique temporary name so a crash or a concurrent
+        # extraction never leaves a partial cache
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        if pages is None:
+            pages = document_processor.iter_pages(file_path, file_type)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                for page_text in pages:
+                    file.write(page_text)
+                    file.write("\n")
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    with open(cache_path, "r", encoding="utf-8") as file:
+        head = file.read(4096).lstrip()[:201]
+    return head[:200] + "..." if len(head) > 200 else head.rstrip()
+
+def iter_cached_text(file_path: str, block_size: int = 1024 * 1024) -> Iterator[str]:
+    """Read extracted text back in blocks that end on line breaks"""
+    with open(get_text_cache_path(file_path), "r", encoding="utf-8") as file:
+        while block := file.read(block_size):
+            yield block + file.readline()
+
+def iter_document_chunks(file_path: str, chunk_size: int = 1000, overlap: int = 100) -> Iterator[Dict[str, Any]]:
+    """Stream quality chunks from the extracted-text file"""
+    pages = iter_cached_text(file_path)
+    return iter_quality_chunks(document_processor.chunk_stream(pages, chunk_size, overlap))
+
+def chunk_cached_text(file_path: str, chunk_size: int = 1000, overlap: int = 100) -> List[Dict[str, Any]]:
+    """Chunk the extracted-text file, keeping only quality chunks"""
+    return list(iter_document_chunks(file_path, chunk_size, overlap))
+
 # Global processor instance
 document_processor = DocumentProcessor()
\ No newline at end of file
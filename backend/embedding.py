@@ -1,15 +1,21 @@
+import asyncio
 import logging
-from typing import List, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import torch
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 class EmbeddingEngine:
     def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
         self.model_name = model_name
         self.model = None
+        self.dimension: Optional[int] = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Embedding engine initialized with device: {self.device}")
     
@@ -18,31 +24,141 @@ class EmbeddingEngine:
         if self.model is None:
             logger.info(f"Loading model: {self.model_name}")
             self.model = SentenceTransformer(self.model_name, device=self.device)
+            if self.device == "cuda":
+                # Half precision halves memory traffic on the GPU forward pass
+                self.model = self.model.half()
+            self.dimension = self.model.get_sentence_embedding_dimension()
             logger.info("Model loaded successfully")
     
-    def embed_texts(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
-        """Generate embeddings for list of texts"""
+    def embed_texts(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Generate unit-length embeddings for list of texts in one encode call"""
         if not self.model:
             self.load_model()
         
         embeddings = self.model.encode(
             texts,
-            batch_size=batch_size,
-            show_progress_bar=True,
-            convert_to_numpy=True
+            batch_size=batch_size or self._batch_size_for(texts),
+            show_progress_bar=False,
+            convert_to_tensor=True,
+            normalize_embeddings=True
         )
         
-        return embeddings.tolist()
+        # One device-to-host copy of the whole batch, kept as a float32 matrix
+        return embeddings.float().cpu().numpy()
+    
+    def _batch_size_for(self, texts: List[str]) -> int:
+        """Larger batches for short texts, the configured size for long ones"""
+        avg_len = sum(map(len, texts)) / max(1, len(texts))
+        if avg_len < 256:
+            return settings.embedding_batch_size * 4
+        if avg_len < 1024:
+            return settings.embedding_batch_size * 2
+        return settings.embedding_batch_size
     
-    def embed_single_text(self, text: str) -> List[float]:
+    def embed_single_text(self, text: str) -> np.ndarray:
         """Generate embedding for single text"""
         return self.embed_texts([text])[0]
     
     def get_embedding_dimension(self) -> int:
-        """Get embedding dimension"""
-        if not self.model:
+        """Get embedding dimension (recorded when the model loads)"""
+        if self.dimension is None:
             self.load_model()
-        return self.model.get_sentence_embedding_dimension()
+        return self.dimension
+
+class EmbeddingBatcher:
+    """Coalesce texts from concurrent requests into shared encode calls"""
+    
+    def __init__(self, engine: EmbeddingEngine, max_batch: int = 32, max_wait: float = 0.05):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+    
+    def _ensure_worker(self):
+        """Start the consumer task on the running event loop"""
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        """Collect up to max_batch texts or wait max_wait, then encode once"""
+        while True:
+            items = [await self.queue.get()]
+            if self.queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(items) < self.max_batch and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            
+            texts = [text for text, _ in items]
+            try:
+                embeddings = await asyncio.to_thread(self.engine.embed_texts, texts, self.max_batch)
+            except Exception as e:
+                logger.error(f"Batched embedding failed: {e}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(items, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+    
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Queue texts for batched embedding and wait for their vectors"""
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
 
 # Global embedding engine
-embedding_engine = EmbeddingEngine()
\ No newline at end of file
+embedding_engine = EmbeddingEngine()
+embedding_batcher = EmbeddingBatcher(embedding_engine)
+# Interactive queries wait only a few milliseconds for company
+query_batcher = EmbeddingBatcher(embedding_engine, max_wait=0.008)
+
+_QUERY_CACHE_SIZE = 4096
+_query_vectors: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+_query_vectors_lock = threading.Lock()
+
+def _normalize_query(query: str) -> str:
+    # The model is uncased, so case and spacing don't change the embedding
+    return " ".join(query.lower().split())
+
+def _cached_query_vector(key: str) -> Optional[Tuple[float, ...]]:
+    with _query_vectors_lock:
+        vector = _query_vectors.get(key)
+        if vector is not None:
+            _query_vectors.move_to_end(key)
+        return vector
+
+def _remember_query_vector(key: str, vector: Tuple[float, ...]):
+    with _query_vectors_lock:
+        _query_vectors[key] = vector
+        _query_vectors.move_to_end(key)
+        if len(_query_vectors) > _QUERY_CACHE_SIZE:
+            _query_vectors.popitem(last=False)
+
+def embed_query(query: str) -> List[float]:
+    """Embed a search query, reusing the vector for repeated queries"""
+    key = _normalize_query(query)
+    vector = _cached_query_vector(key)
+    if vector is None:
+        vector = tuple(embedding_engine.embed_single_text(key).tolist())
+        _remember_query_vector(key, vector)
+    return list(vector)
+
+async def embed_query_batched(query: str) -> List[float]:
+    """Embed a search query, batching cache misses with concurrent queries"""
+    key = _normalize_query(query)
+    vector = _cached_query_vector(key)
+    if vector is None:
+        embedding, = await query_batcher.embed([key])
+        vector = tuple(embedding.tolist())
+        _remember_query_vector(key, vector)
+    return list(vector)
@@ -1,24 +1,70 @@
 import logging
+import time
 import httpx
-import json
-from typing import Iterator, Optional, Dict, Any
+import orjson
+from typing import AsyncIterator, Iterator, Optional, Dict, Any
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+async def _iter_ndjson(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """Parse an NDJSON stream from raw bytes, skipping malformed lines"""
+    pending = b""
+    async for data in response.aiter_bytes():
+        *lines, pending = (pending + data).split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+    if pending.strip():
+        try:
+            yield orjson.loads(pending)
+        except orjson.JSONDecodeError:
+            pass
+
 class OllamaClient:
+    # Availability rarely changes, so one probe is shared for this many seconds
+    availability_ttl = 5.0
+    availability_timeout = 0.5
+    
     def __init__(self):
         self.base_url = settings.ollama_url
         self.model = settings.ollama_model
-        self.client = httpx.AsyncClient(timeout=60.0)
+        # One pooled client for generation, streaming and health checks;
+        # HTTP/2 is negotiated when Ollama is served over TLS
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=300.0),
+                retries=1
+            )
+        )
+        self._available = False
+        self._checked_at = float("-inf")
     
     async def is_available(self) -> bool:
-        """Check if Ollama is available"""
+        """Check if Ollama is available (cached for availability_ttl seconds)"""
+        now = time.monotonic()
+        if now - self._checked_at < self.availability_ttl:
+            return self._available
+        
         try:
-            response = await self.client.get(f"{self.base_url}/api/version")
-            return response.status_code == 200
+            response = await self.client.get(
+                f"{self.base_url}/api/version",
+                timeout=self.availability_timeout
+            )
+            self._available = response.status_code == 200
         except:
-            return False
+            self._available = False
+        self._checked_at = now
+        return self._available
+    
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.aclose()
     
     async def pull_model(self) -> bool:
         """Pull model if not available"""
@@ -52,7 +98,7 @@ class OllamaClient:
             if stream:
                 return response.text
             else:
-                result = response.json()
+                result = orjson.loads(response.content)
                 return result.get("response", "")
                 
         except Exception as e:
@@ -76,16 +122,11 @@ class OllamaClient:
                 if response.status_code != 200:
                     raise Exception(f"Ollama error: {response.status_code}")
                 
-                async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if "response" in data:
-                                yield data["response"]
-                            if data.get("done", False):
-                                break
-                        except json.JSONDecodeError:
-                            continue
+                async for data in _iter_ndjson(response):
+                    if "response" in data:
+                        yield data["response"]
+                    if data.get("done", False):
+                        break
                             
         except Exception as e:
             logger.error(f"Streaming failed: {e}")
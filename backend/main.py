@@ -1,13 +1,16 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
-from datetime import datetime
 from config import settings
-from api_routes import router
+from utils import now_cached
+from api_routes import router, processing_pool
 from schemas import ErrorResponse
 from database import init_database
+from llm import ollama_client
+from embedding import embedding_engine
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,8 +28,15 @@ async def lifespan(app: FastAPI):
         logger.info("Database initialized")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
+    # Load the embedding model up front so the first request doesn't pay for it
+    try:
+        await asyncio.to_thread(embedding_engine.load_model)
+    except Exception as e:
+        logger.error(f"Embedding model load failed: {e}")
     yield
     logger.info("Shutting down RAG Desktop App...")
+    processing_pool.shutdown(wait=False, cancel_futures=True)
+    await ollama_client.close()
 
 def create_app() -> FastAPI:
     """Create FastAPI application"""
@@ -34,6 +44,7 @@ def create_app() -> FastAPI:
         title=settings.app_name,
         version=settings.app_version,
         description="Enterprise RAG Desktop Application",
+        default_response_class=ORJSONResponse,
         lifespan=lifespan
     )
     
@@ -52,12 +63,12 @@ def create_app() -> FastAPI:
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
         logger.error(f"Global exception: {exc}", exc_info=True)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content=ErrorResponse(
                 error="Internal server error",
                 detail=str(exc) if settings.debug else None
-            ).dict()
+            ).model_dump()
         )
     
     return app
@@ -69,14 +80,14 @@ async def root():
     return {
         "message": "RAG Desktop App API",
         "version": settings.app_version,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_cached().isoformat()
     }
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_cached().isoformat(),
         "services": {
             "api": "running",
             "database": "unknown",
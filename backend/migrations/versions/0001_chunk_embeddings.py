@@ -0,0 +1,29 @@
+"""Add staged chunk embeddings and the document hash index
+
+Revision ID: 0001_chunk_embeddings
+Revises:
+Create Date: 2026-10-16 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_chunk_embeddings"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Databases created by create_all before migrations existed; some may
+    # already have these from the startup upgrade this revision replaces
+    inspector = sa.inspect(op.get_bind())
+    chunk_columns = {column["name"] for column in inspector.get_columns("document_chunks")}
+    if "embedding" not in chunk_columns:
+        op.add_column("document_chunks", sa.Column("embedding", sa.LargeBinary(), nullable=True))
+    
+    document_indexes = {index["name"] for index in inspector.get_indexes("documents")}
+    if "ix_documents_file_hash" not in document_indexes:
+        op.create_index("ix_documents_file_hash", "documents", ["file_hash"])
+
+def downgrade():
+    op.drop_index("ix_documents_file_hash", table_name="documents")
+    op.drop_column("document_chunks", "embedding")
@@ -1,45 +1,85 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+import numpy as np
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-import uuid
+from qdrant_client.models import (
+    Distance, VectorParams, Batch, Filter, FieldCondition, MatchValue, HasIdCondition,
+    FilterSelector, SearchRequest,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams
+)
+from rank_bm25 import BM25Okapi
+from sqlalchemy import func
 
+from cache import SemanticCache, ttl_cache
 from config import settings
+from database import SessionLocal, DBDocument, DBChunk
+from embedding import embed_query, embed_query_batched
 from llm import ollama_client
 from web_search import web_search
 logger = logging.getLogger(__name__)
 
+# Stored and query vectors are unit length, so the collection ranks by plain dot
+# product: the cosine without recomputing both norms per comparison.
+
 class VectorStore:
+    # Points per upsert request
+    upsert_batch_size = 256
+    
     def __init__(self):
         self.client = None
         self.collection_name = "documents"
+        self._ready_collections: Set[str] = set()
     
     def connect(self):
         """Connect to Qdrant"""
         if not self.client:
-            self.client = QdrantClient(url=settings.qdrant_url)
+            self.client = QdrantClient(
+                url=settings.qdrant_url,
+                prefer_grpc=settings.qdrant_prefer_grpc,
+                grpc_port=settings.qdrant_grpc_port
+            )
             logger.info(f"Connected to Qdrant at {settings.qdrant_url}")
     
     def ensure_collection(self, vector_size: int = 384):
-        """Ensure collection exists"""
+        """Ensure collection exists (checked against Qdrant once per process)"""
+        if self.collection_name in self._ready_collections:
+            return
         if not self.client:
             self.connect()
         
         try:
-            collections = self.client.get_collections()
-            collection_exists = any(col.name == self.collection_name for col in collections.collections)
-            
-            if not collection_exists:
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-                )
+            if not self._collection_exists():
+                try:
+                    self.client.create_collection(
+                        collection_name=self.collection_name,
+                        vectors_config=VectorParams(size=vector_size, distance=Distance.DOT),
+                        # int8 copies kept in RAM for search; originals are used for rescoring.
+                        # The int8 range spans the 99th percentile so rare outliers don't cost resolution.
+                        quantization_config=ScalarQuantization(
+                            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+                        )
+                    )
+                except Exception:
+                    # Another worker may have created it first
+                    if not self._collection_exists():
+                        raise
                 logger.info(f"Created collection: {self.collection_name}")
             else:
                 logger.info(f"Collection exists: {self.collection_name}")
         except Exception as e:
             logger.error(f"Collection setup failed: {e}")
             raise
+        
+        self._ready_collections.add(self.collection_name)
+    
+    def _collection_exists(self) -> bool:
+        collections = self.client.get_collections()
+        return any(col.name == self.collection_name for col in collections.collections)
     
     def store_embeddings(self, doc_id: str, chunks: List[Dict[str, Any]]):
         """Store embeddings in Qdrant"""
@@ -52,88 +92,274 @@ class VectorStore:
         else:
             raise ValueError("No embeddings found in chunks")
         
-        # Prepare points
-        points = []
-        for chunk in chunks:
-            if "embedding" not in chunk:
-                continue
-                
-            point = PointStruct(
-                id=chunk["id"],
-                vector=chunk["embedding"],
-                payload={
-                    "document_id": doc_id,
-                    "chunk_index": chunk["index"],
-                    "text": chunk["text"],
-                    "length": chunk["length"],
-                    "created_at": chunk["created_at"].isoformat()
-                }
-            )
-            points.append(point)
+        # Unit length, so the DOT distance is the cosine
+        chunks = [chunk for chunk in chunks if "embedding" in chunk]
+        vectors = np.vstack([chunk["embedding"] for chunk in chunks]).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
         
-        # Upsert points
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
-        )
+        # Column-wise batch: no PointStruct object per chunk
+        ids = [chunk["id"] for chunk in chunks]
+        vectors = vectors.tolist()
+        payloads = [
+            {
+                "document_id": doc_id,
+                "chunk_index": chunk["index"],
+                "text": chunk["text"],
+                "length": chunk["length"],
+                "created_at": chunk["created_at"].isoformat()
+            }
+            for chunk in chunks
+        ]
+        
+        # Upsert in batches; updates apply in order, so waiting on the last one covers all
+        for start in range(0, len(ids), self.upsert_batch_size):
+            end = start + self.upsert_batch_size
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=Batch(ids=ids[start:end], vectors=vectors[start:end], payloads=payloads[start:end]),
+                wait=end >= len(ids)
+            )
         
-        logger.info(f"Stored {len(points)} vectors for document: {doc_id}")
-        return len(points)
+        logger.info(f"Stored {len(ids)} vectors for document: {doc_id}")
+        return len(ids)
     
-    def search_similar(self, query_vector: List[float], limit: int = 5, doc_filter: Optional[str] = None):
-        """Search for similar vectors"""
+    def delete_document(self, doc_id: str):
+        """Delete all vectors of a document in one request"""
         self.connect()
         
-        search_filter = None
-        if doc_filter:
-            search_filter = Filter(
-                must=[FieldCondition(key="document_id", match=MatchValue(value=doc_filter))]
+        try:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(
+                    filter=Filter(must=[FieldCondition(key="document_id", match=MatchValue(value=doc_id))])
+                )
             )
+        except Exception as e:
+            # Nothing to delete if the document was never stored
+            logger.warning(f"Vector delete failed for document {doc_id}: {e}")
+    
+    def search_similar(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        doc_filter: Optional[str] = None,
+        point_ids: Optional[List[str]] = None
+    ):
+        """Search for similar vectors, optionally only among the given point IDs"""
+        self.connect()
         
         results = self.client.search(
             collection_name=self.collection_name,
             query_vector=query_vector,
             limit=limit,
-            query_filter=search_filter
+            query_filter=self._search_filter(doc_filter, point_ids),
+            search_params=self._search_params
         )
         
         return results
+    
+    def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        doc_filter: Optional[str] = None,
+        point_ids: Optional[List[str]] = None
+    ):
+        """Search for several query vectors under the same filter in one request"""
+        self.connect()
+        
+        search_filter = self._search_filter(doc_filter, point_ids)
+        requests = [
+            SearchRequest(
+                vector=query_vector,
+                limit=limit,
+                filter=search_filter,
+                params=self._search_params,
+                with_payload=True
+            )
+            for query_vector in query_vectors
+        ]
+        
+        return self.client.search_batch(collection_name=self.collection_name, requests=requests)
+    
+    # Search the int8 copies, then rescore the oversampled hits with the originals
+    _search_params = SearchParams(
+        quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+    )
+    
+    @staticmethod
+    def _search_filter(doc_filter: Optional[str], point_ids: Optional[List[str]]) -> Optional[Filter]:
+        conditions = []
+        if doc_filter:
+            conditions.append(FieldCondition(key="document_id", match=MatchValue(value=doc_filter)))
+        if point_ids:
+            conditions.append(HasIdCondition(has_id=point_ids))
+        return Filter(must=conditions) if conditions else None
 
 # Global vector store
 vector_store = VectorStore()
 
+_TOKEN_RE = re.compile(r"\w+")
+
+# Words that suggest the answer depends on recent information
+_TIME_SENSITIVE_RE = re.compile(r"\b(?:latest|recent|current|today|2024|2025|now)\b", re.IGNORECASE)
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+class BM25Index:
+    """Keyword index over stored chunks, rebuilt when the stored set changes"""
+    
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self._bm25: Optional[BM25Okapi] = None
+        self._chunk_ids: List[str] = []
+        self._signature = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _stored_chunks(db):
+        return (
+            db.query(DBChunk)
+            .join(DBDocument, DBChunk.document_id == DBDocument.id)
+            .filter(DBDocument.processing_status == "stored")
+        )
+    
+    @staticmethod
+    def _signature_of(stored_chunks) -> Tuple:
+        return tuple(
+            stored_chunks.with_entities(func.count(DBChunk.id), func.max(DBChunk.created_at)).one()
+        )
+    
+    def signature(self) -> Tuple:
+        """Count and newest creation time of stored chunks; changes whenever any process stores or deletes"""
+        db = SessionLocal()
+        try:
+            return self._signature_of(self._stored_chunks(db))
+        finally:
+            db.close()
+    
+    def _refresh(self):
+        """Rebuild from the database if stored chunks changed since the last check"""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        
+        db = SessionLocal()
+        try:
+            stored_chunks = self._stored_chunks(db)
+            signature = self._signature_of(stored_chunks)
+            if signature == self._signature:
+                return
+            rows = stored_chunks.with_entities(DBChunk.id, DBChunk.chunk_text).all()
+        finally:
+            db.close()
+        
+        self._chunk_ids = [row.id for row in rows]
+        self._bm25 = BM25Okapi([_tokenize(row.chunk_text) for row in rows]) if rows else None
+        self._signature = signature
+        logger.info(f"BM25 index rebuilt over {len(rows)} chunks")
+    
+    def top_ids(self, query: str, n: int) -> List[str]:
+        """Chunk IDs of the n best keyword matches, best first"""
+        with self._lock:
+            self._refresh()
+            bm25, chunk_ids = self._bm25, self._chunk_ids
+        
+        tokens = _tokenize(query)
+        if bm25 is None or not tokens:
+            return []
+        
+        scores = bm25.get_scores(tokens)
+        top = np.argsort(scores)[::-1][:n]
+        return [chunk_ids[i] for i in top if scores[i] > 0]
+
 
 
 class RAGPipeline:
+    # Reciprocal rank fusion constant
+    rrf_k = 60
+    
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
         self.fallback_threshold = 0.3  # If best result score below this, use web search
+        self.keyword_index = BM25Index(settings.bm25_refresh_interval)
+        self.answer_cache = SemanticCache(
+            settings.semantic_cache_size,
+            settings.semantic_cache_threshold,
+            settings.semantic_cache_ttl,
+            settings.semantic_cache_enabled
+        )
     
-    def retrieve_context(self, query: str, max_results: int = 5, max_context_length: int = 2000) -> str:
-        """Retrieve relevant context for query"""
-        from embedding import embedding_engine
+    @ttl_cache(ttl=1.0)
+    async def _corpus_signature(self) -> Tuple:
+        """Stored-corpus signature from the database, so writes by Celery or other workers count too"""
+        return await asyncio.to_thread(self.keyword_index.signature)
+    
+    def search(self, query: str, limit: int = 5, query_embedding: Optional[List[float]] = None):
+        """Hybrid search: vector and BM25 rankings fused by reciprocal rank"""
+        if query_embedding is None:
+            query_embedding = embed_query(query)
         
-        # Generate query embedding
-        query_embedding = embedding_engine.embed_single_text(query)
+        vector_results = self.vector_store.search_similar(query_vector=query_embedding, limit=limit)
         
-        # Search similar chunks
-        results = self.vector_store.search_similar(
+        candidate_ids = []
+        if settings.hybrid_search_enabled:
+            candidate_ids = self.keyword_index.top_ids(query, settings.bm25_candidates)
+        
+        # No keyword overlap (or hybrid disabled): plain vector search
+        if not candidate_ids:
+            return vector_results
+        
+        # A keyword-only hit ranked below `limit` scores less than every vector hit,
+        # so only the top `limit` keyword hits are fetched (with their vector scores)
+        keyword_results = self.vector_store.search_similar(
             query_vector=query_embedding,
-            limit=max_results
+            limit=limit,
+            point_ids=candidate_ids[:limit]
         )
         
-        # Build context from results
-        context_parts = []
-        total_length = 0
+        keyword_rank = {chunk_id: rank for rank, chunk_id in enumerate(candidate_ids)}
+        vector_rank = {str(result.id): rank for rank, result in enumerate(vector_results)}
+        results = {str(result.id): result for result in [*keyword_results, *vector_results]}
         
-        for result in results:
-            text = result.payload.get("text", "")
-            if total_length + len(text) > max_context_length:
-                break
-            context_parts.append(f"[Score: {result.score:.3f}] {text}")
-            total_length += len(text)
+        def fused(chunk_id: str) -> float:
+            score = 0.0
+            if chunk_id in vector_rank:
+                score += 1 / (self.rrf_k + vector_rank[chunk_id])
+            if chunk_id in keyword_rank:
+                score += 1 / (self.rrf_k + keyword_rank[chunk_id])
+            return score
+        
+        ranked = sorted(results, key=fused, reverse=True)
+        return [results[chunk_id] for chunk_id in ranked[:limit]]
+    
+    def retrieve_context(
+        self,
+        query: str,
+        max_results: int = 5,
+        max_context_length: int = 2000,
+        query_embedding: Optional[List[float]] = None
+    ) -> str:
+        """Retrieve relevant context for query"""
+        # Search similar chunks
+        results = self.search(query, max_results, query_embedding)
         
-        return "\n\n".join(context_parts)
+        # Build context from results
+        return self._build_context(results, max_context_length, "Score")
+    
+    @staticmethod
+    def _build_context(results: List, max_length: int, label: str) -> str:
+        """Join the leading results whose combined text fits in max_length"""
+        texts = [result.payload.get("text", "") for result in results]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        cut = int(np.searchsorted(np.cumsum(lengths), max_length, side="right"))
+        return "\n\n".join(
+            f"[{label}: {result.score:.3f}] {text}"
+            for result, text in zip(results[:cut], texts[:cut])
+        )
     
     def should_use_fallback(self, local_results: List, query: str) -> bool:
         """Determine if web search fallback should be used"""
@@ -148,8 +374,7 @@ class RAGPipeline:
             return True
         
         # Check for time-sensitive queries
-        time_indicators = ["latest", "recent", "current", "today", "2024", "2025", "now"]
-        if any(indicator in query.lower() for indicator in time_indicators):
+        if _TIME_SENSITIVE_RE.search(query):
             logger.info("Using web fallback - time-sensitive query detected")
             return True
         
@@ -160,45 +385,41 @@ class RAGPipeline:
         query: str, 
         max_results: int = 5, 
         max_context_length: int = 2000,
-        use_fallback: bool = True
+        use_fallback: bool = True,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """Retrieve context with web search fallback"""
-        from embedding import embedding_engine
-        
-        # First try local search
-        query_embedding = embedding_engine.embed_single_text(query)
-        local_results = self.vector_store.search_similar(
-            query_vector=query_embedding,
-            limit=max_results
-        )
+        if query_embedding is None:
+            query_embedding = await embed_query_batched(query)
         
-        local_context = ""
-        web_context = ""
+        # Start the web search alongside the local one; it is cancelled if not needed
+        web_task = None
+        if use_fallback and settings.web_search_speculative and web_search.is_available():
+            web_task = asyncio.create_task(web_search.search(query, 3, query_embedding))
         
-        # Build local context
-        if local_results:
-            context_parts = []
-            total_length = 0
+        try:
+            # Local search runs off the event loop: it may rebuild the BM25 index from the DB
+            local_results = await asyncio.to_thread(self.search, query, max_results, query_embedding)
             
-            for result in local_results:
-                text = result.payload.get("text", "")
-                if total_length + len(text) > max_context_length // 2:  # Reserve space for web
-                    break
-                context_parts.append(f"[Local Score: {result.score:.3f}] {text}")
-                total_length += len(text)
+            local_context = ""
+            web_context = ""
             
-            local_context = "\n\n".join(context_parts)
-        
-        # Check if web fallback needed
-        use_web = use_fallback and self.should_use_fallback(local_results, query)
-        
-        if use_web:
-            try:
-                from web_search import web_search
-                web_results = await web_search.search(query, max_results=3)
-                web_context = web_search.format_web_context(web_results)
-            except Exception as e:
-                logger.error(f"Web search fallback failed: {e}")
+            # Build local context, reserving half the space for web results
+            if local_results:
+                local_context = self._build_context(local_results, max_context_length // 2, "Local Score")
+            
+            # Check if web fallback needed
+            use_web = use_fallback and self.should_use_fallback(local_results, query)
+            
+            if use_web:
+                try:
+                    web_results = await (web_task or web_search.search(query, 3, query_embedding))
+                    web_context = web_search.format_web_context(web_results)
+                except Exception as e:
+                    logger.error(f"Web search fallback failed: {e}")
+        finally:
+            if web_task and not web_task.done():
+                web_task.cancel()
         
         return {
             "local_context": local_context,
@@ -237,9 +458,20 @@ class RAGPipeline:
     ) -> Dict[str, Any]:
         """Complete RAG pipeline with web fallback"""
         try:
+            # Embed once, batched with concurrent queries, for the cache and the search
+            query_embedding = await embed_query_batched(query)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            
+            # A near-identical recent question is answered from the cache,
+            # unless documents were stored or deleted since it was answered
+            cache_key = ("fallback", max_results, use_fallback, await self._corpus_signature())
+            cached = self.answer_cache.get(query_vector, cache_key)
+            if cached is not None:
+                return {**cached, "query": query}
+            
             # Retrieve context with fallback
             context_data = await self.retrieve_context_with_fallback(
-                query, max_results, use_fallback=use_fallback
+                query, max_results, use_fallback=use_fallback, query_embedding=query_embedding
             )
             
             # Build hybrid prompt
@@ -252,7 +484,7 @@ class RAGPipeline:
             # Generate answer
             answer = await ollama_client.generate_response(prompt)
             
-            return {
+            result = {
                 "query": query,
                 "answer": answer,
                 "local_context": context_data["local_context"],
@@ -261,6 +493,8 @@ class RAGPipeline:
                 "local_results_count": context_data["local_results_count"],
                 "status": "completed"
             }
+            self.answer_cache.put(query_vector, cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"RAG with fallback failed: {e}")
@@ -288,8 +522,21 @@ Answer:"""
     async def generate_answer(self, query: str, max_results: int = 5) -> Dict[str, Any]:
         """Complete RAG pipeline with LLM generation"""
         try:
-            # Retrieve context
-            context = self.retrieve_context(query, max_results)
+            # Embed once, batched with concurrent queries, for the cache and the search
+            query_embedding = await embed_query_batched(query)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            
+            # A near-identical recent question is answered from the cache,
+            # unless documents were stored or deleted since it was answered
+            cache_key = ("answer", max_results, await self._corpus_signature())
+            cached = self.answer_cache.get(query_vector, cache_key)
+            if cached is not None:
+                return {**cached, "query": query}
+            
+            # Retrieve context off the event loop
+            context = await asyncio.to_thread(
+                self.retrieve_context, query, max_results, query_embedding=query_embedding
+            )
             
             # Build prompt
             prompt = self.build_rag_prompt(query, context)
@@ -297,12 +544,14 @@ Answer:"""
             # Generate answer
             answer = await ollama_client.generate_response(prompt)
             
-            return {
+            result = {
                 "query": query,
                 "context": context,
                 "answer": answer,
                 "status": "completed"
             }
+            self.answer_cache.put(query_vector, cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"RAG generation failed: {e}")
@@ -316,8 +565,12 @@ Answer:"""
     async def stream_answer(self, query: str, max_results: int = 5):
         """Stream RAG answer"""
         try:
-            # Retrieve context
-            context = self.retrieve_context(query, max_results)
+            query_embedding = await embed_query_batched(query)
+            
+            # Retrieve context off the event loop
+            context = await asyncio.to_thread(
+                self.retrieve_context, query, max_results, query_embedding=query_embedding
+            )
             
             # Build prompt
             prompt = self.build_rag_prompt(query, context)
@@ -330,5 +583,5 @@ Answer:"""
             logger.error(f"RAG streaming failed: {e}")
             yield f"Error: {str(e)}"
 
-# Update global pipeline
+# Global RAG pipeline
 rag_pipeline = RAGPipeline(vector_store)
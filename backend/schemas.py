@@ -1,13 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
 
 class BaseResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     success: bool = True
     message: str = "Success"
 
 class HealthResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     status: str
     timestamp: datetime
     services: Dict[str, str]
@@ -18,6 +22,8 @@ class DocumentUpload(BaseModel):
     size: int
 
 class DocumentChunk(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     id: str
     index: int
     text: str
@@ -25,6 +31,8 @@ class DocumentChunk(BaseModel):
     created_at: datetime
 
 class DocumentResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     id: str
     title: str
     file_type: str
@@ -33,14 +41,19 @@ class DocumentResponse(BaseModel):
     processing_status: str
     chunk_count: int = 0
     text_preview: Optional[str] = None
+    task_id: Optional[str] = None
 
 class DocumentListResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     documents: List[DocumentResponse]
     total: int
     page: int
     limit: int
 
 class DocumentChunksResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     document_id: str
     chunks: List[DocumentChunk]
     total_chunks: int
@@ -50,11 +63,15 @@ class ProcessDocumentRequest(BaseModel):
     overlap: int = 100
 
 class ErrorResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     success: bool = False
     error: str
     detail: Optional[str] = None
 
 class DocumentChunkWithEmbedding(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     id: str
     index: int
     text: str
@@ -63,6 +80,8 @@ class DocumentChunkWithEmbedding(BaseModel):
     created_at: datetime
 
 class EmbeddingResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     document_id: str
     chunks_processed: int
     embedding_dimension: int
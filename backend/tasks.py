@@ -0,0 +1,94 @@
+import logging
+from celery import Celery, chain
+
+from config import settings
+from database import SessionLocal, DBDocument
+from documents import (
+    extract_text_to_cache, iter_document_chunks, process_document_with_embeddings,
+    save_chunks_to_db, save_chunk_embeddings, load_chunks_from_db, update_document_status
+)
+from rag import vector_store
+
+logger = logging.getLogger(__name__)
+
+celery_app = Celery(
+    "rag",
+    broker=settings.celery_broker_url,
+    backend=settings.celery_result_backend
+)
+
+def _mark_failed(db, doc_id: str):
+    """Discard the failed transaction and record the failure on the document"""
+    db.rollback()
+    update_document_status(db, doc_id, "failed")
+
+@celery_app.task(bind=True, acks_late=True)
+def extract_task(self, doc_id: str) -> str:
+    """Extract text from an uploaded document to its text file"""
+    db = SessionLocal()
+    try:
+        document = db.query(DBDocument).filter(DBDocument.id == doc_id).first()
+        if not document:
+            raise ValueError(f"Document not found: {doc_id}")
+
+        document.text_preview = extract_text_to_cache(document.file_path, document.file_type)
+        document.processing_status = "extracted"
+        db.commit()
+
+        logger.info(f"[{self.request.id}] Text extracted for document: {doc_id}")
+        return document.file_path
+    except Exception as e:
+        logger.error(f"[{self.request.id}] Text extraction failed for {doc_id}: {e}")
+        _mark_failed(db, doc_id)
+        raise
+    finally:
+        db.close()
+
+@celery_app.task(bind=True, acks_late=True)
+def chunk_task(self, file_path: str, doc_id: str, chunk_size: int = 1000, overlap: int = 100) -> int:
+    """Stream quality chunks from the extracted text file into the database"""
+    db = SessionLocal()
+    try:
+        chunk_count = save_chunks_to_db(db, doc_id, iter_document_chunks(file_path, chunk_size, overlap))
+        update_document_status(db, doc_id, "chunked", chunk_count)
+    except Exception as e:
+        logger.error(f"[{self.request.id}] Chunking failed for {doc_id}: {e}")
+        _mark_failed(db, doc_id)
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"[{self.request.id}] Document chunked: {doc_id} ({chunk_count} chunks)")
+    return chunk_count
+
+@celery_app.task(bind=True, acks_late=True)
+def embed_task(self, chunk_count: int, doc_id: str) -> int:
+    """Generate embeddings for saved chunks and store them in Qdrant"""
+    if not chunk_count:
+        return 0
+
+    db = SessionLocal()
+    try:
+        chunks = load_chunks_from_db(db, doc_id)
+        chunks = process_document_with_embeddings(doc_id, chunks)
+        save_chunk_embeddings(db, chunks)
+        stored_count = vector_store.store_embeddings(doc_id, chunks)
+        update_document_status(db, doc_id, "stored")
+    except Exception as e:
+        logger.error(f"[{self.request.id}] Embedding failed for {doc_id}: {e}")
+        _mark_failed(db, doc_id)
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"[{self.request.id}] Vectors stored for document: {doc_id}")
+    return stored_count
+
+def enqueue_document_pipeline(doc_id: str) -> str:
+    """Queue extract -> chunk -> embed for a document and return the job id"""
+    result = chain(
+        extract_task.s(doc_id),
+        chunk_task.s(doc_id),
+        embed_task.s(doc_id)
+    ).apply_async()
+    return result.id
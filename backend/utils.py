@@ -1,39 +1,61 @@
+import asyncio
 import os
-import mimetypes
-import hashlib
+import queue
+import stat
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 import re
 
+import aiofiles
+from blake3 import blake3
+from starlette.formparsers import MultiPartParser
+
 logger = logging.getLogger(__name__)
 
+# Copy buffer for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Reusable copy buffers so concurrent uploads don't allocate per chunk
+_BUFFER_POOL: "queue.LifoQueue[bytearray]" = queue.LifoQueue(maxsize=32)
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds the size limit while streaming"""
+    pass
+
+# Supported upload types by extension
+_FILE_TYPES = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".doc": "docx",
+    ".txt": "txt",
+    ".md": "txt",
+}
+
+# Characters not allowed in stored filenames
+_UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
+
+# (monotonic time of last refresh, cached wall-clock datetime)
+_last_timestamp: List[Any] = [0.0, None]
+
+def now_cached() -> datetime:
+    """Current time at one-second resolution for status timestamps"""
+    t = time.monotonic()
+    if _last_timestamp[1] is None or t - _last_timestamp[0] > 1.0:
+        _last_timestamp[0], _last_timestamp[1] = t, datetime.now()
+    return _last_timestamp[1]
+
 def generate_file_id() -> str:
     """Generate unique file ID"""
-    import uuid
     return str(uuid.uuid4())
 
 def get_file_type(filename: str) -> str:
     """Get file type from filename"""
-    mime_type, _ = mimetypes.guess_type(filename)
-    if mime_type:
-        if "pdf" in mime_type:
-            return "pdf"
-        elif "word" in mime_type or "document" in mime_type:
-            return "docx"
-        elif "text" in mime_type:
-            return "txt"
-    
-    # Fallback to extension
-    ext = Path(filename).suffix.lower()
-    if ext == ".pdf":
-        return "pdf"
-    elif ext in [".docx", ".doc"]:
-        return "docx"
-    elif ext in [".txt", ".md"]:
-        return "txt"
-    else:
-        return "unknown"
+    return _FILE_TYPES.get(Path(filename).suffix.lower(), "unknown")
 
 def validate_file_size(file_size: int, max_size_mb: int = 50) -> bool:
     """Validate file size"""
@@ -45,8 +67,22 @@ def sanitize_filename(filename: str) -> str:
     # Remove path traversal attempts
     filename = os.path.basename(filename)
     # Remove dangerous characters
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    return filename
+    return _UNSAFE_FILENAME_RE.sub('_', filename)
+
+@contextmanager
+def _acquire_buffer() -> Iterator[bytearray]:
+    """Borrow an upload copy buffer from the pool"""
+    try:
+        buf = _BUFFER_POOL.get_nowait()
+    except queue.Empty:
+        buf = bytearray(UPLOAD_CHUNK_SIZE)
+    try:
+        yield buf
+    finally:
+        try:
+            _BUFFER_POOL.put_nowait(buf)
+        except queue.Full:
+            pass
 
 def create_upload_dir() -> Path:
     """Create upload directory if it doesn't exist"""
@@ -54,43 +90,86 @@ def create_upload_dir() -> Path:
     upload_dir.mkdir(exist_ok=True)
     return upload_dir
 
-def save_uploaded_file(file_content: bytes, filename: str) -> str:
-    """Save uploaded file and return file path"""
+async def save_uploaded_file(upload_file, filename: str, max_size_mb: int = 50) -> Tuple[str, int]:
+    """Stream uploaded file to disk and return file path and size"""
     upload_dir = create_upload_dir()
     safe_filename = sanitize_filename(filename)
-    file_path = upload_dir / safe_filename
+    # Unique prefix instead of probing for a free name
+    file_path = upload_dir / f"{uuid.uuid4().hex}_{safe_filename}"
     
-    # Add timestamp if file exists
-    counter = 1
-    original_path = file_path
-    while file_path.exists():
-        stem = original_path.stem
-        suffix = original_path.suffix
-        file_path = upload_dir / f"{stem}_{counter}{suffix}"
-        counter += 1
+    src = upload_file.file
+    bytes_written = 0
+    try:
+        # Uploads spooled to disk are copied inside the kernel, no userspace buffer
+        src_fd = _disk_spooled_fileno(upload_file) if hasattr(os, "sendfile") else None
+        if src_fd is not None:
+            size = os.fstat(src_fd).st_size
+            if not validate_file_size(size, max_size_mb):
+                raise FileTooLargeError(f"File exceeds {max_size_mb}MB limit")
+            bytes_written = await asyncio.to_thread(_sendfile_copy, src_fd, file_path, size)
+            return str(file_path), bytes_written
+        
+        with _acquire_buffer() as buf, memoryview(buf) as view:
+            async with aiofiles.open(file_path, "wb", buffering=UPLOAD_CHUNK_SIZE) as f:
+                # The upload is still in memory, so readinto is a memcpy
+                while n := src.readinto(buf):
+                    bytes_written += n
+                    if not validate_file_size(bytes_written, max_size_mb):
+                        raise FileTooLargeError(f"File exceeds {max_size_mb}MB limit")
+                    await f.write(view[:n])
+    except Exception:
+        # Don't leave partial uploads behind
+        file_path.unlink(missing_ok=True)
+        raise
     
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    
-    return str(file_path)
+    return str(file_path), bytes_written
+
+# Starlette's in-memory spool limit (max_file_size before it was renamed)
+_SPOOL_MAX_SIZE = getattr(MultiPartParser, "spool_max_size", None) or getattr(MultiPartParser, "max_file_size", 1024 * 1024)
+
+def _disk_spooled_fileno(upload_file) -> Optional[int]:
+    """Descriptor of an upload already rolled over to a regular file, else None"""
+    # Starlette spools to disk only past spool_max_size; asking a smaller
+    # in-memory spool for fileno() would force that rollover
+    size = getattr(upload_file, "size", None)
+    if size is None or size <= _SPOOL_MAX_SIZE:
+        return None
+    try:
+        fd = upload_file.file.fileno()
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            return fd
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _sendfile_copy(src_fd: int, file_path: Path, size: int) -> int:
+    """Copy size bytes from the start of src_fd into a new file with sendfile"""
+    dst_fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+        return offset
+    finally:
+        os.close(dst_fd)
 
 def get_file_hash(file_path: str) -> str:
-    """Get MD5 hash of file"""
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    """Get BLAKE3 hash of file (content fingerprint for duplicate uploads)"""
+    # Memory-mapped, so BLAKE3 can hash the whole file across threads at once
+    hasher = blake3(max_threads=blake3.AUTO)
+    hasher.update_mmap(file_path)
+    return hasher.hexdigest()
+
+# Runs of whitespace and special characters (punctuation is kept)
+_CLEAN_RE = re.compile(r'[^\w\.,!?;:()\-\'""]+')
 
 def clean_text(text: str) -> str:
     """Clean text for processing"""
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
-    # Remove special characters but keep punctuation
-    text = re.sub(r'[^\w\s\.,!?;:()\-\'""]', ' ', text)
-    # Remove multiple spaces
-    text = re.sub(r' +', ' ', text)
-    return text.strip()
+    # One pass collapses whitespace and replaces special characters
+    return _CLEAN_RE.sub(' ', text).strip()
 
 def split_text_by_paragraphs(text: str) -> List[str]:
     """Split text into paragraphs"""
@@ -101,10 +180,13 @@ def count_words(text: str) -> int:
     """Count words in text"""
     return len(text.split())
 
-def validate_chunk_quality(chunk_text: str, min_length: int = 50) -> bool:
-    """Validate if chunk has sufficient content"""
-    if len(chunk_text.strip()) < min_length:
-        return False
-    if count_words(chunk_text) < 5:
-        return False
-    return True
\ No newline at end of file
+# Matches when the text starts with at least five whitespace-separated words
+_FIVE_WORDS_RE = re.compile(r"\s*\S+(?:\s+\S+){4}")
+
+def iter_quality_chunks(chunks: Iterable[Dict[str, Any]], min_length: int = 50) -> Iterator[Dict[str, Any]]:
+    """Yield only chunks with sufficient content"""
+    match = _FIVE_WORDS_RE.match
+    return (
+        chunk for chunk in chunks
+        if len(chunk["text"].strip()) >= min_length and match(chunk["text"])
+    )
@@ -1,6 +1,8 @@
 import logging
 from typing import List, Dict, Any, Optional
-import asyncio
+import numpy as np
+
+from cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
@@ -9,14 +11,19 @@ class WebSearchManager:
         self.tavily_client = None
         self.api_key = None
         self.settings = None
+        self.result_cache: Optional[SemanticCache] = None
         
     def _load_settings(self):
-        """Load settings without relative import"""
+        """Load settings once (already parsed from .env at startup)"""
         if not self.settings:
-            import os
-            from dotenv import load_dotenv
-            load_dotenv()
-            self.api_key = os.getenv("TAVILY_API_KEY", "")
+            from config import settings
+            self.settings = settings
+            self.api_key = settings.tavily_api_key
+            self.result_cache = SemanticCache(
+                settings.web_cache_size,
+                settings.web_cache_threshold,
+                settings.web_cache_ttl
+            )
             
     def _init_client(self):
         """Initialize Tavily client"""
@@ -25,8 +32,8 @@ class WebSearchManager:
             
         if not self.tavily_client and self.api_key:
             try:
-                from tavily import TavilyClient
-                self.tavily_client = TavilyClient(api_key=self.api_key)
+                from tavily import AsyncTavilyClient
+                self.tavily_client = AsyncTavilyClient(api_key=self.api_key)
                 logger.info("Tavily client initialized successfully")
             except Exception as e:
                 logger.error(f"Tavily client initialization failed: {e}")
@@ -37,12 +44,25 @@ class WebSearchManager:
             self._load_settings()
         return bool(self.api_key)
     
-    async def search(self, query: str, max_results: int = 3) -> List[Dict[str, Any]]:
-        """Search web using Tavily"""
+    async def search(
+        self,
+        query: str,
+        max_results: int = 3,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search web using Tavily, reusing results for near-identical embedded queries"""
         if not self.is_available():
             logger.warning("Web search not available - no API key")
             return []
         
+        query_vector = None
+        if query_embedding is not None:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            cached = self.result_cache.get(query_vector, max_results)
+            if cached is not None:
+                logger.info(f"Web search served from cache: {len(cached)} results")
+                return cached
+        
         try:
             self._init_client()
             
@@ -50,17 +70,13 @@ class WebSearchManager:
                 logger.error("Tavily client not initialized")
                 return []
             
-            # Use asyncio to run sync tavily client
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.tavily_client.search(
-                    query=query,
-                    search_depth="basic",
-                    max_results=max_results,
-                    include_answer=True,
-                    include_raw_content=False
-                )
+            # Async client: the request runs on the event loop, no worker thread
+            response = await self.tavily_client.search(
+                query=query,
+                search_depth="basic",
+                max_results=max_results,
+                include_answer=True,
+                include_raw_content=False
             )
             
             results = []
@@ -73,6 +89,8 @@ class WebSearchManager:
                 })
             
             logger.info(f"Web search completed: {len(results)} results")
+            if query_vector is not None and results:
+                self.result_cache.put(query_vector, max_results, results)
             return results
             
         except Exception as e:
@@ -4,20 +4,94 @@ Handles communication with the backend API
 """
 
 import asyncio
+import atexit
+import concurrent.futures
+import functools
 import logging
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
 import httpx
-from typing import Dict, Any, List, Optional, AsyncGenerator
+import orjson
+from typing import Dict, Any, List, Optional, AsyncGenerator, Tuple
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Read size when streaming uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Keep-alive pool limits for API connections
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+# Requests in flight, shared by concurrent identical calls (see APIClient._single_flight)
+_inflight_requests: Dict[Tuple, asyncio.Task] = {}
+
+@functools.lru_cache(maxsize=8)
+def _request_headers(auth_token: Optional[str]) -> Dict[str, str]:
+    """JSON request headers for a token, built once per token"""
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    if auth_token:
+        headers["Authorization"] = f"Bearer {auth_token}"
+    return headers
+
+class QueryCache:
+    """Recent query results by normalized query text, dropped when documents change"""
+    
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = True  # turned off for sessions that must always hit the backend
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(kind: str, query: str, *params) -> Tuple:
+        """Cache key; the backend's embedding model is uncased, so case and spacing don't matter"""
+        return (kind, " ".join(query.lower().split()), *params)
+    
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Cached value if present and not expired"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key: Tuple, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all entries (documents or user changed)"""
+        with self._lock:
+            self._entries.clear()
+
 class APIClient:
     """Async API client for backend communication"""
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", cache: Optional[QueryCache] = None):
         self.base_url = base_url
         self.auth_token: Optional[str] = None
         self.client: Optional[httpx.AsyncClient] = None
+        self.cache = cache
         
     async def __aenter__(self):
         """Async context manager entry"""
@@ -31,11 +105,7 @@ class APIClient:
     async def connect(self):
         """Connect to the API"""
         try:
-            self.client = httpx.AsyncClient(
-                base_url=self.base_url,
-                timeout=30.0,
-                headers={"User-Agent": "RAG-Desktop/1.0"}
-            )
+            self.client = _new_http_client(self.base_url)
             logger.info(f"Connected to API at {self.base_url}")
         except Exception as e:
             logger.error(f"Failed to connect to API: {e}")
@@ -48,32 +118,26 @@ class APIClient:
             logger.info("Disconnected from API")
             
     def get_headers(self) -> Dict[str, str]:
-        """Get request headers"""
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        if self.auth_token:
-            headers["Authorization"] = f"Bearer {self.auth_token}"
-        return headers
+        """Get request headers (shared per token; don't modify)"""
+        return _request_headers(self.auth_token)
         
     async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request to API"""
         if not self.client:
             raise Exception("API client not connected")
             
-        url = f"{self.base_url}{endpoint}"
         headers = self.get_headers()
         
         try:
+            # The client carries base_url, so the endpoint path is enough
             response = await self.client.request(
                 method=method,
-                url=url,
+                url=endpoint,
                 headers=headers,
                 **kwargs
             )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
             raise
@@ -102,23 +166,59 @@ class APIClient:
             return []
             
     async def upload_document(self, file_path: str, progress_callback=None) -> Dict[str, Any]:
-        """Upload document to API"""
-        if not Path(file_path).exists():
+        """Upload document to API as a streamed multipart body (progress as bytes sent, total)"""
+        path = Path(file_path)
+        if not path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
             
         try:
-            with open(file_path, "rb") as f:
-                files = {"file": (Path(file_path).name, f, "application/octet-stream")}
-                response = await self.client.post(
-                    f"{self.base_url}/api/v1/documents/upload",
-                    files=files,
-                    headers={"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
-                )
-                response.raise_for_status()
-                return response.json()
+            boundary = secrets.token_hex(16)
+            # Quotes and line breaks are percent-encoded as browsers do, so a
+            # filename can't close the parameter or start another part header
+            filename = (
+                path.name.replace("\\", "\\\\")
+                .replace('"', "%22")
+                .replace("\r", "%0D")
+                .replace("\n", "%0A")
+            )
+            head = (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            tail = f"\r\n--{boundary}--\r\n".encode()
+            size = path.stat().st_size
+            
+            headers = {
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(len(head) + size + len(tail))
+            }
+            if self.auth_token:
+                headers["Authorization"] = f"Bearer {self.auth_token}"
+            
+            response = await self.client.post(
+                "/api/v1/documents/upload",
+                content=self._multipart_file_body(path, size, head, tail, progress_callback),
+                headers=headers
+            )
+            response.raise_for_status()
+            self._invalidate_cache()
+            return orjson.loads(response.content)
         except Exception as e:
             logger.error(f"Upload failed: {e}")
             raise
+    
+    async def _multipart_file_body(self, path: Path, size: int, head: bytes, tail: bytes, progress_callback=None):
+        """Yield the multipart body, reading the file off the event loop one chunk at a time"""
+        yield head
+        sent = 0
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                yield chunk
+                sent += len(chunk)
+                if progress_callback:
+                    progress_callback(sent, size)
+        yield tail
             
     async def get_documents(self, skip: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
         """Get list of documents"""
@@ -128,21 +228,68 @@ class APIClient:
         except Exception:
             return []
             
+    async def iter_documents(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield every document from one streamed NDJSON response, as rows arrive"""
+        async with self.client.stream(
+            "GET",
+            "/api/v1/documents/stream",
+            headers=self.get_headers()
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield orjson.loads(line)
+            
     async def get_document_details(self, doc_id: str) -> Dict[str, Any]:
         """Get document details"""
         return await self._make_request("GET", f"/api/v1/documents/{doc_id}")
         
+    async def get_documents_batch(self, doc_ids: List[str], include_chunks: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Details (and optionally chunks) of many documents in one request, keyed by ID"""
+        try:
+            return await self._make_request(
+                "POST",
+                "/api/v1/documents/batch",
+                json={"ids": doc_ids, "include_chunks": include_chunks}
+            )
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in (404, 405):
+                raise
+        
+        # Older backend without the batch endpoint: fetch each document concurrently
+        async def _fetch(doc_id: str) -> Optional[Dict[str, Any]]:
+            try:
+                document = await self.get_document_details(doc_id)
+            except httpx.HTTPStatusError as e:
+                # Unknown IDs are left out, as the batch endpoint does
+                if e.response.status_code == 404:
+                    return None
+                raise
+            if include_chunks:
+                document["chunks"] = await self.get_document_chunks(doc_id)
+            return document
+        
+        documents = await asyncio.gather(*(_fetch(doc_id) for doc_id in doc_ids))
+        return {
+            doc_id: document
+            for doc_id, document in zip(doc_ids, documents)
+            if document is not None
+        }
+            
     async def delete_document(self, doc_id: str) -> bool:
         """Delete document"""
         try:
             await self._make_request("DELETE", f"/api/v1/documents/{doc_id}")
+            self._invalidate_cache()
             return True
         except Exception:
             return False
             
     async def process_document(self, doc_id: str) -> Dict[str, Any]:
         """Process document"""
-        return await self._make_request("POST", f"/api/v1/documents/{doc_id}/process")
+        response = await self._make_request("POST", f"/api/v1/documents/{doc_id}/process")
+        self._invalidate_cache()
+        return response
         
     async def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
         """Get document chunks"""
@@ -153,28 +300,49 @@ class APIClient:
             return []
             
     async def rag_query(self, query: str, max_results: int = 5) -> str:
-        """Perform RAG query"""
-        try:
-            response = await self._make_request(
-                "POST", 
-                "/api/v1/rag/answer-with-fallback",
-                json={"query": query, "max_results": max_results}
-            )
-            return response.get("answer", "No answer available")
-        except Exception as e:
-            logger.error(f"RAG query failed: {e}")
-            return f"Error: {e}"
+        """Perform RAG query, answering repeated questions from the cache"""
+        cache_key = QueryCache.key("rag", query, max_results)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        async def _fetch():
+            try:
+                response = await self._make_request(
+                    "POST", 
+                    "/api/v1/rag/answer-with-fallback",
+                    json={"query": query, "max_results": max_results}
+                )
+                answer = response.get("answer", "No answer available")
+                if response.get("status") == "completed":
+                    self._remember(cache_key, answer)
+                return answer
+            except Exception as e:
+                logger.error(f"RAG query failed: {e}")
+                return f"Error: {e}"
+        
+        return await self._single_flight(cache_key, _fetch)
             
     async def semantic_search(self, query: str, document_ids: Optional[List[str]] = None, limit: int = 10) -> List[Dict[str, Any]]:
-        """Perform semantic search"""
-        try:
-            payload = {"query": query, "limit": limit}
-            if document_ids:
-                payload["document_ids"] = document_ids
-            response = await self._make_request("POST", "/api/v1/search/semantic", json=payload)
-            return response.get("results", [])
-        except Exception:
-            return []
+        """Perform semantic search, reusing results for repeated queries"""
+        cache_key = QueryCache.key("search", query, limit, tuple(document_ids or ()))
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        async def _fetch():
+            try:
+                payload = {"query": query, "limit": limit}
+                if document_ids:
+                    payload["document_ids"] = document_ids
+                response = await self._make_request("POST", "/api/v1/search/semantic", json=payload)
+                results = response.get("results", [])
+                self._remember(cache_key, results)
+                return results
+            except Exception:
+                return []
+        
+        return await self._single_flight(cache_key, _fetch)
             
     async def web_search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """Perform web search"""
@@ -193,16 +361,24 @@ class APIClient:
         try:
             async with self.client.stream(
                 "POST",
-                f"{self.base_url}/api/v1/rag/stream",
+                "/api/v1/rag/stream",
                 json={"query": query, "max_results": max_results},
                 headers=self.get_headers()
             ) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
-                        if data == "[DONE]":
-                            break
-                        yield data
+                # Split SSE frames on raw bytes; a frame boundary never falls inside
+                # a UTF-8 sequence, so each complete frame decodes on its own
+                buffer = bytearray()
+                async for chunk in response.aiter_bytes():
+                    buffer += chunk
+                    while (end := buffer.find(b"\n\n")) != -1:
+                        frame = bytes(buffer[:end])
+                        del buffer[:end + 2]
+                        data = b"\n".join(
+                            line[6:] for line in frame.split(b"\n") if line.startswith(b"data: ")
+                        )
+                        if data == b"[DONE]":
+                            return
+                        yield data.decode("utf-8")
         except Exception as e:
             logger.error(f"Stream RAG query failed: {e}")
             yield f"Error: {e}"
@@ -232,6 +408,31 @@ class APIClient:
         except Exception:
             return False
     
+    # Query cache
+    async def _single_flight(self, key: Tuple, fetch):
+        """Run fetch() once for concurrent identical calls; every caller awaits the shared result"""
+        loop = asyncio.get_running_loop()
+        key = (loop, self.base_url, self.auth_token, *key)
+        task = _inflight_requests.get(key)
+        if task is None:
+            # Its own task, so cancelling one caller (even the first) leaves the others waiting
+            task = loop.create_task(fetch())
+            _inflight_requests[key] = task
+            task.add_done_callback(lambda _: _inflight_requests.pop(key, None))
+        return await asyncio.shield(task)
+    
+    def _cached(self, key: Tuple) -> Optional[Any]:
+        return self.cache.get(key) if self.cache else None
+    
+    def _remember(self, key: Tuple, value: Any):
+        if self.cache:
+            self.cache.put(key, value)
+    
+    def _invalidate_cache(self):
+        """Cached answers may be stale once the document set changes"""
+        if self.cache:
+            self.cache.clear()
+    
     # Authentication methods
     def set_auth_token(self, token: str):
         """Set authentication token"""
@@ -272,6 +473,59 @@ class APIError(Exception):
     """Custom exception for API errors"""
     pass
 
+def _new_http_client(base_url: str) -> httpx.AsyncClient:
+    """HTTP client with the app's defaults and a keep-alive pool"""
+    # HTTP/2 is negotiated over TLS, letting concurrent calls share one connection
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=True,
+        timeout=30.0,
+        headers={"User-Agent": "RAG-Desktop/1.0"},
+        limits=POOL_LIMITS
+    )
+
+class _LoopThread:
+    """Event loop running forever on a daemon thread, fed from other threads"""
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="api-client-loop", daemon=True)
+        self.thread.start()
+    
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def stop(self):
+        """Stop the loop and wait for its thread to finish"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+# Every sync call runs on this one loop, so the shared clients below (and
+# their pooled connections) outlive individual calls
+_loop_thread = _LoopThread()
+_shared_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _shared_http_client(base_url: str) -> httpx.AsyncClient:
+    """Long-lived client per base URL (only used on the background loop)"""
+    client = _shared_clients.get(base_url)
+    if client is None or client.is_closed:
+        client = _new_http_client(base_url)
+        _shared_clients[base_url] = client
+    return client
+
+@atexit.register
+def _shutdown_loop_thread():
+    """Close pooled connections, then stop the background loop"""
+    async def _close_all():
+        await asyncio.gather(*(client.aclose() for client in _shared_clients.values()))
+    
+    try:
+        _loop_thread.submit(_close_all()).result(timeout=5)
+    except Exception as e:
+        logger.warning(f"Failed to close API connections: {e}")
+    _loop_thread.stop()
+
 # Synchronous wrapper for use in Qt threads
 class SyncAPIClient:
     """Synchronous wrapper for APIClient to use in Qt threads"""
@@ -279,111 +533,135 @@ class SyncAPIClient:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
         self.auth_token: Optional[str] = None
+        self.query_cache = QueryCache()
         
     def _run_async(self, coro):
-        """Run async coroutine in new event loop"""
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            return loop.run_until_complete(coro)
-        finally:
-            try:
-                loop.close()
-            except:
-                pass
+        """Run async coroutine on the shared background loop and wait for it"""
+        return _loop_thread.submit(coro).result()
+    
+    def _client(self, authenticated: bool = True) -> APIClient:
+        """APIClient over the shared connection pool (call on the background loop)"""
+        client = APIClient(self.base_url, self.query_cache)
+        client.client = _shared_http_client(self.base_url)
+        if authenticated:
+            client.auth_token = self.auth_token
+        return client
+    
+    def run_parallel(self, *calls) -> List[Any]:
+        """Run APIClient calls concurrently, e.g. run_parallel(("get_documents",), ("rag_query", "hi"))"""
+        async def _gather():
+            client = self._client()
+            return await asyncio.gather(*(getattr(client, name)(*args) for name, *args in calls))
+        return list(self._run_async(_gather()))
     
     def set_auth_token(self, token: str):
         """Set authentication token"""
         self.auth_token = token
+        self.query_cache.clear()
         
     def clear_auth_token(self):
         """Clear authentication token"""
         self.auth_token = None
+        self.query_cache.clear()
+    
+    def set_query_caching(self, enabled: bool):
+        """Turn the local answer cache on or off for this session"""
+        self.query_cache.enabled = enabled
+        if not enabled:
+            self.query_cache.clear()
     
     def test_connection(self) -> bool:
         """Sync version of test_connection"""
         async def _test():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.test_connection()
+            return await self._client().test_connection()
         return self._run_async(_test())
         
-    def upload_document(self, file_path: str) -> Dict[str, Any]:
-        """Sync version of upload_document"""
-        async def _upload():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.upload_document(file_path)
-        return self._run_async(_upload())
+    def upload_document(self, file_path: str, progress_callback=None) -> Dict[str, Any]:
+        """Sync version of upload_document (progress_callback runs on the calling thread)"""
+        if progress_callback is None:
+            async def _upload():
+                return await self._client().upload_document(file_path)
+            return self._run_async(_upload())
+        
+        # The upload runs on the background loop; its progress is handed back
+        # here so the callback may touch widgets owned by this thread
+        updates: queue.SimpleQueue = queue.SimpleQueue()
+        
+        async def _upload_with_progress():
+            return await self._client().upload_document(
+                file_path, lambda sent, total: updates.put((sent, total))
+            )
+        
+        future = _loop_thread.submit(_upload_with_progress())
+        while not future.done():
+            try:
+                progress_callback(*updates.get(timeout=0.05))
+            except queue.Empty:
+                pass
+        while not updates.empty():
+            progress_callback(*updates.get_nowait())
+        return future.result()
         
     def get_documents(self) -> List[Dict[str, Any]]:
         """Sync version of get_documents"""
         async def _get_docs():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.get_documents()
+            return await self._client().get_documents()
         return self._run_async(_get_docs())
         
+    def get_all_documents(self) -> List[Dict[str, Any]]:
+        """All documents in one streamed request instead of paging"""
+        async def _get_all():
+            return [doc async for doc in self._client().iter_documents()]
+        return self._run_async(_get_all())
+        
+    def get_documents_batch(self, doc_ids: List[str], include_chunks: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Sync version of get_documents_batch"""
+        async def _get_batch():
+            return await self._client().get_documents_batch(doc_ids, include_chunks)
+        return self._run_async(_get_batch())
+        
     def rag_query(self, query: str) -> str:
         """Sync version of rag_query"""
         async def _query():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.rag_query(query)
+            return await self._client().rag_query(query)
         return self._run_async(_query())
         
     def semantic_search(self, query: str) -> List[Dict[str, Any]]:
         """Sync version of semantic_search"""
         async def _search():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.semantic_search(query)
+            return await self._client().semantic_search(query)
         return self._run_async(_search())
         
     # Authentication methods
     def google_oauth_login(self) -> Dict[str, Any]:
         """Sync version of google_oauth_login"""
         async def _login():
-            async with APIClient(self.base_url) as client:
-                return await client.google_oauth_login()
+            return await self._client(authenticated=False).google_oauth_login()
         return self._run_async(_login())
         
     def google_oauth_callback(self, code: str, is_mock: bool = False) -> Dict[str, Any]:
         """Sync version of google_oauth_callback"""
         async def _callback():
-            async with APIClient(self.base_url) as client:
-                payload = {"code": code, "is_mock": is_mock}
-                return await client.google_oauth_callback(code, payload)
+            payload = {"code": code, "is_mock": is_mock}
+            return await self._client(authenticated=False).google_oauth_callback(code, payload)
         return self._run_async(_callback())
         
     def refresh_auth_token(self, refresh_token: str) -> Dict[str, Any]:
         """Sync version of refresh_auth_token"""
         async def _refresh():
-            async with APIClient(self.base_url) as client:
-                return await client.refresh_auth_token(refresh_token)
+            return await self._client(authenticated=False).refresh_auth_token(refresh_token)
         return self._run_async(_refresh())
         
     def get_user_profile(self) -> Dict[str, Any]:
         """Sync version of get_user_profile"""
         async def _profile():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.get_user_profile()
+            return await self._client().get_user_profile()
         return self._run_async(_profile())
         
     def logout_user(self) -> bool:
         """Sync version of logout"""
         async def _logout():
-            async with APIClient(self.base_url) as client:
-                if self.auth_token:
-                    client.set_auth_token(self.auth_token)
-                return await client.logout()
+            return await self._client().logout()
         return self._run_async(_logout())
 
 # Global API client instance
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Backend and frontend modules import each other by bare name, as when run from their directories
+sys.path[:0] = [os.path.join(ROOT, "backend"), os.path.join(ROOT, "frontend")]
+
+# Never touch a developer's Postgres: settings are read once, at first import
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="ragbot-tests-"), "test.db")
+)
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+
+# Backend: coalescing streamed tokens
+
+@pytest.fixture(scope="module")
+def api_routes():
+    return pytest.importorskip("api_routes")
+
+class _Tokens:
+    """Async token generator that records whether it was closed"""
+
+    def __init__(self, count: int, error: Exception = None):
+        self.count = count
+        self.error = error
+        self.closed = False
+
+    async def stream(self):
+        try:
+            for i in range(self.count):
+                yield f"t{i} "
+                await asyncio.sleep(0)
+            if self.error:
+                raise self.error
+        finally:
+            self.closed = True
+
+def test_coalesce_tokens_keeps_every_token(api_routes):
+    tokens = _Tokens(500)
+
+    async def main():
+        return [frame async for frame in api_routes._coalesce_tokens(tokens.stream(), frame_size=64)]
+
+    frames = asyncio.run(main())
+
+    assert "".join(frames) == "".join(f"t{i} " for i in range(500))
+    assert tokens.closed
+
+def test_abandoned_stream_stops_producer_and_closes_upstream(api_routes):
+    # Regression: with the queue full, the producer waited forever to put its
+    # end marker after the client went away, keeping the LLM stream open
+    tokens = _Tokens(100_000)
+
+    async def main():
+        frames = api_routes._coalesce_tokens(tokens.stream())
+        await frames.__anext__()
+        await asyncio.sleep(0.05)  # let the producer fill the queue
+        await asyncio.wait_for(frames.aclose(), timeout=5)
+        await asyncio.sleep(0.05)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    leftover = asyncio.run(main())
+
+    assert leftover == []
+    assert tokens.closed
+
+def test_upstream_error_reaches_the_consumer(api_routes):
+    tokens = _Tokens(5, ValueError("stream broke"))
+
+    async def main():
+        return [frame async for frame in api_routes._coalesce_tokens(tokens.stream())]
+
+    with pytest.raises(ValueError, match="stream broke"):
+        asyncio.run(asyncio.wait_for(main(), timeout=5))
+
+
+# Frontend client
+
+@pytest.fixture(scope="module")
+def api_client():
+    return pytest.importorskip("api_client")
+
+def _client(api_client, handler):
+    """APIClient whose requests are answered by handler instead of the network"""
+    httpx = api_client.httpx
+    client = api_client.APIClient("http://test")
+    client.client = httpx.AsyncClient(base_url="http://test", transport=httpx.MockTransport(handler))
+    return client
+
+def test_stream_rag_query_parses_frames_split_across_chunks(api_client):
+    httpx = api_client.httpx
+    body = (
+        "data: héllo\n\n"
+        "data: two\ndata: lines\n\n"
+        "data: [DONE]\n\n"
+        "data: after done\n\n"
+    ).encode("utf-8")
+    # Split inside frames and inside the two-byte "é"
+    cut = body.index("é".encode("utf-8")) + 1
+    pieces = [body[:3], body[3:cut], body[cut:20], body[20:]]
+
+    async def stream():
+        for piece in pieces:
+            yield piece
+
+    def handler(request):
+        return httpx.Response(200, content=stream(), headers={"Content-Type": "text/event-stream"})
+
+    async def main():
+        client = _client(api_client, handler)
+        try:
+            return [frame async for frame in client.stream_rag_query("question")]
+        finally:
+            await client.disconnect()
+
+    assert asyncio.run(main()) == ["héllo", "two\nlines"]
+
+def test_single_flight_survives_first_caller_cancellation(api_client):
+    # Regression: other callers awaited the first caller's future and were
+    # cancelled along with it
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        client = api_client.APIClient("http://test")
+        first = asyncio.create_task(client._single_flight(("query",), fetch))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(client._single_flight(("query",), fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        results = await asyncio.gather(*others)
+        await asyncio.sleep(0)
+        return first.cancelled(), results, dict(api_client._inflight_requests)
+
+    first_cancelled, results, inflight = asyncio.run(main())
+
+    assert first_cancelled
+    assert results == ["answer"] * 3
+    assert calls == 1
+    assert inflight == {}
+
+def test_single_flight_shares_errors_and_separates_keys(api_client):
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        if key == "bad":
+            raise ValueError("failed")
+        return key
+
+    async def main():
+        client = api_client.APIClient("http://test")
+        return await asyncio.gather(
+            client._single_flight(("bad",), lambda: fetch("bad")),
+            client._single_flight(("bad",), lambda: fetch("bad")),
+            client._single_flight(("good",), lambda: fetch("good")),
+            return_exceptions=True
+        )
+
+    bad, bad_again, good = asyncio.run(main())
+
+    assert isinstance(bad, ValueError) and bad_again is bad
+    assert good == "good"
+    assert sorted(calls) == ["bad", "good"]
+
+def test_batch_fallback_skips_unknown_documents(api_client):
+    httpx = api_client.httpx
+
+    def handler(request):
+        if request.url.path == "/api/v1/documents/batch":
+            return httpx.Response(404, json={"detail": "Not Found"})
+        if request.url.path == "/api/v1/documents/known":
+            return httpx.Response(200, json={"id": "known"})
+        return httpx.Response(404, json={"detail": "Document not found"})
+
+    async def main():
+        client = _client(api_client, handler)
+        try:
+            return await client.get_documents_batch(["known", "missing"])
+        finally:
+            await client.disconnect()
+
+    assert asyncio.run(main()) == {"known": {"id": "known"}}
+
+def test_upload_filename_cannot_inject_part_headers(api_client, tmp_path):
+    httpx = api_client.httpx
+    path = tmp_path / 'evil"\r\nX-Injected: 1.txt'
+    path.write_bytes(b"content")
+    bodies = []
+
+    async def handler(request):
+        bodies.append(await request.aread())
+        return httpx.Response(200, json={"id": "doc"})
+
+    async def main():
+        client = _client(api_client, handler)
+        try:
+            return await client.upload_document(str(path))
+        finally:
+            await client.disconnect()
+
+    assert asyncio.run(main()) == {"id": "doc"}
+    head = bodies[0].split(b"\r\n\r\n", 1)[0]
+    assert b'filename="evil%22%0D%0AX-Injected: 1.txt"' in head
+    assert b"\r\nX-Injected" not in head
@@ -0,0 +1,58 @@
+import pytest
+
+database = pytest.importorskip("database")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+HEAD = "0001_chunk_embeddings"
+
+def _reset():
+    database.Base.metadata.drop_all(bind=database.engine)
+    with database.engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+
+def _schema():
+    inspector = sqlalchemy.inspect(database.engine)
+    chunk_columns = {column["name"] for column in inspector.get_columns("document_chunks")}
+    document_indexes = {index["name"] for index in inspector.get_indexes("documents")}
+    with database.engine.connect() as connection:
+        version = connection.exec_driver_sql("SELECT version_num FROM alembic_version").scalar()
+    return chunk_columns, document_indexes, version
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    if database.engine.dialect.name != "sqlite":
+        pytest.skip("migration tests only run against the throwaway SQLite database")
+    _reset()
+    yield
+    _reset()
+
+def test_fresh_database_is_created_and_stamped():
+    database.create_tables()
+
+    chunk_columns, document_indexes, version = _schema()
+    assert "embedding" in chunk_columns
+    assert "ix_documents_file_hash" in document_indexes
+    assert version == HEAD
+
+def test_existing_database_is_migrated():
+    # Schema as create_all built it before staged embeddings and the hash index
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_documents_file_hash")
+        connection.exec_driver_sql("ALTER TABLE document_chunks DROP COLUMN embedding")
+
+    database.create_tables()
+
+    chunk_columns, document_indexes, version = _schema()
+    assert "embedding" in chunk_columns
+    assert "ix_documents_file_hash" in document_indexes
+    assert version == HEAD
+
+def test_migration_tolerates_columns_already_present():
+    # Current schema without migration history, as the removed startup upgrade left it
+    database.Base.metadata.create_all(bind=database.engine)
+
+    database.create_tables()
+    database.create_tables()
+
+    assert _schema()[2] == HEAD
@@ -0,0 +1,227 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+# Chunking
+
+@pytest.fixture(scope="module")
+def processor():
+    documents = pytest.importorskip("documents")
+    return documents.document_processor
+
+def _chunks(processor, pages, target_size, overlap):
+    return list(processor._adaptive_chunk(iter(pages), target_size, overlap))
+
+def _sample_text(seed: int, words: int) -> str:
+    rng = random.Random(seed)
+    vocabulary = ["alpha", "beta", "gamma", "delta", "epsilon.", "zeta!", "eta?", "theta"]
+    # Prefixes keep every word unique, so positions can be recovered from chunks
+    return " ".join(f"w{i}{rng.choice(vocabulary)}" for i in range(words))
+
+def test_short_text_is_one_chunk(processor):
+    assert _chunks(processor, ["One sentence. Two."], 100, 10) == ["One sentence. Two."]
+
+def test_chunks_respect_target_size(processor):
+    text = _sample_text(1, 2000)
+    for target_size, overlap in [(50, 0), (200, 30), (1000, 100)]:
+        chunks = _chunks(processor, [text], target_size, overlap)
+        assert chunks
+        assert all(0 < len(chunk) <= target_size for chunk in chunks)
+
+def test_chunks_cover_text_without_overlap(processor):
+    text = _sample_text(2, 1500)
+    chunks = _chunks(processor, [text], 120, 0)
+    assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
+
+def test_overlapping_chunks_always_advance(processor):
+    # Regression: a chunk ending on a sentence whose last word held the overlap
+    # start used to be followed by shrinking fragments of that word
+    chunks = _chunks(processor, ["One. Two words here. Three is longer sentence."], 20, 5)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk not in previous
+
+    text = _sample_text(3, 1500)
+    chunks = _chunks(processor, [text], 100, 30)
+    start = end = 0
+    for chunk in chunks:
+        position = text.find(chunk, start)
+        # Each chunk overlaps or touches the previous one and reaches past it
+        assert 0 <= position <= end + 1
+        assert position + len(chunk) > end
+        start, end = position + 1, position + len(chunk)
+    assert end == len(text)
+
+def test_pages_chunk_like_the_joined_text(processor):
+    text = _sample_text(4, 3000)
+    words = text.split(" ")
+    rng = random.Random(4)
+    pages, i = [], 0
+    while i < len(words):
+        size = rng.randint(1, 60)
+        pages.append(" ".join(words[i:i + size]))
+        i += size
+
+    for target_size, overlap in [(80, 0), (300, 50)]:
+        assert _chunks(processor, pages, target_size, overlap) == _chunks(processor, [text], target_size, overlap)
+
+
+# Staged embeddings
+
+def test_packed_embeddings_round_trip_exactly():
+    documents = pytest.importorskip("documents")
+    embeddings = np.random.default_rng(0).standard_normal((5, 384)).astype(np.float32)
+
+    packed = documents._pack_embeddings(embeddings)
+
+    assert len(packed) == 5
+    for vector, blob in zip(embeddings, packed):
+        assert np.array_equal(documents._unpack_embedding(blob), vector)
+
+
+# Semantic cache
+
+@pytest.fixture
+def cache_module():
+    return pytest.importorskip("cache")
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_semantic_cache_hits_near_identical_query(cache_module):
+    cache = cache_module.SemanticCache(size=8, threshold=0.95)
+    cache.put(_unit([1, 0, 0]), "answer", "cached")
+
+    assert cache.get(_unit([1, 0.01, 0]), "answer") == "cached"
+    assert cache.get(_unit([0, 1, 0]), "answer") is None
+    assert cache.get(_unit([1, 0, 0]), "other key") is None
+
+def test_semantic_cache_prefers_most_similar_entry(cache_module):
+    cache = cache_module.SemanticCache(size=8, threshold=0.9)
+    cache.put(_unit([1, 0.2, 0]), "answer", "farther")
+    cache.put(_unit([1, 0.05, 0]), "answer", "closer")
+    cache.put(_unit([1, 0, 0]), "other key", "wrong key")
+
+    assert cache.get(_unit([1, 0, 0]), "answer") == "closer"
+
+def test_semantic_cache_expires_entries(cache_module):
+    cache = cache_module.SemanticCache(size=8, ttl=0.0)
+    cache.put(_unit([1, 0, 0]), "answer", "cached")
+
+    assert cache.get(_unit([1, 0, 0]), "answer") is None
+
+def test_semantic_cache_overwrites_oldest_slot(cache_module):
+    cache = cache_module.SemanticCache(size=2)
+    cache.put(_unit([1, 0, 0]), "answer", "first")
+    cache.put(_unit([0, 1, 0]), "answer", "second")
+    cache.put(_unit([0, 0, 1]), "answer", "third")
+
+    assert cache.get(_unit([1, 0, 0]), "answer") is None
+    assert cache.get(_unit([0, 1, 0]), "answer") == "second"
+    assert cache.get(_unit([0, 0, 1]), "answer") == "third"
+
+def test_semantic_cache_disabled(cache_module):
+    for cache in (cache_module.SemanticCache(size=0), cache_module.SemanticCache(enabled=False)):
+        cache.put(_unit([1, 0, 0]), "answer", "cached")
+        assert cache.get(_unit([1, 0, 0]), "answer") is None
+
+
+# Embedding batcher
+
+class _FakeEngine:
+    def __init__(self, error: Exception = None):
+        self.calls = []
+        self.error = error
+
+    def embed_texts(self, texts, batch_size):
+        self.calls.append(list(texts))
+        if self.error:
+            raise self.error
+        return [np.array([len(text)], dtype=np.float32) for text in texts]
+
+def test_batcher_coalesces_concurrent_requests():
+    embedding = pytest.importorskip("embedding")
+    engine = _FakeEngine()
+
+    async def main():
+        batcher = embedding.EmbeddingBatcher(engine, max_batch=32, max_wait=0.01)
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["bb", "ccc"]), batcher.embed(["dddd"]))
+
+    results = asyncio.run(main())
+
+    assert [[float(vector[0]) for vector in vectors] for vectors in results] == [[1], [2, 3], [4]]
+    assert engine.calls == [["a", "bb", "ccc", "dddd"]]
+
+def test_batcher_splits_at_max_batch():
+    embedding = pytest.importorskip("embedding")
+    engine = _FakeEngine()
+
+    async def main():
+        batcher = embedding.EmbeddingBatcher(engine, max_batch=2, max_wait=0.01)
+        return await batcher.embed(["a", "b", "c", "d", "e"])
+
+    assert len(asyncio.run(main())) == 5
+    assert all(len(call) <= 2 for call in engine.calls)
+
+def test_batcher_fails_every_waiter_and_keeps_running():
+    embedding = pytest.importorskip("embedding")
+    engine = _FakeEngine(ValueError("model failed"))
+
+    async def main():
+        batcher = embedding.EmbeddingBatcher(engine, max_wait=0.01)
+        results = await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+        engine.error = None
+        return results, await batcher.embed(["after"])
+
+    results, after = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert float(after[0][0]) == len("after")
+
+
+# Hybrid search
+
+class _FakeVectorStore:
+    """Ranks points by fixed similarity scores, optionally only among given IDs"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def search_similar(self, query_vector, limit=5, doc_filter=None, point_ids=None):
+        ids = self.scores if point_ids is None else [i for i in point_ids if i in self.scores]
+        ranked = sorted(ids, key=self.scores.get, reverse=True)[:limit]
+        return [SimpleNamespace(id=i, score=self.scores[i], payload={}) for i in ranked]
+
+def test_hybrid_search_keeps_semantic_only_matches():
+    rag = pytest.importorskip("rag")
+    if not rag.settings.hybrid_search_enabled:
+        pytest.skip("hybrid search disabled in settings")
+
+    # "semantic" shares no keyword with the query; "keyword" is a weak vector match
+    scores = {"semantic": 0.9, "both": 0.8, "keyword": 0.1, "other": 0.5}
+    pipeline = rag.RAGPipeline(_FakeVectorStore(scores))
+    pipeline.keyword_index.top_ids = lambda query, n: ["keyword", "both"]
+
+    results = pipeline.search("query", limit=3, query_embedding=[1.0])
+    ids = [result.id for result in results]
+
+    assert len(ids) == 3
+    assert ids[0] == "both"  # ranked by both lists
+    assert "semantic" in ids
+    assert "keyword" in ids
+    assert "other" not in ids
+
+def test_search_without_keyword_hits_is_plain_vector_search():
+    rag = pytest.importorskip("rag")
+    scores = {"a": 0.9, "b": 0.8, "c": 0.1}
+    pipeline = rag.RAGPipeline(_FakeVectorStore(scores))
+    pipeline.keyword_index.top_ids = lambda query, n: []
+
+    results = pipeline.search("query", limit=2, query_embedding=[1.0])
+
+    assert [result.id for result in results] == ["a", "b"]